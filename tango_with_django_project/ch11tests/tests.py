@@ -1,6 +1,10 @@
 from django.test import TestCase
 from datetime import datetime, timedelta
 from django.core.urlresolvers import reverse
+from django.conf import settings
+from django.core import signing
+from django.contrib.sessions.backends.db import SessionStore
+from rango.visits import VISITS_COOKIE, VISITS_SALT, epoch_day, visits_cookie_value
 
 # Create your tests here.
 class Chapter11SessionTests(TestCase):
@@ -8,25 +12,34 @@ class Chapter11SessionTests(TestCase):
         #Access index page 100 times
         for i in xrange(0, 100):
             self.client.get(reverse('index'))
-            session = self.client.session
+            cookie = self.client.cookies[VISITS_COOKIE].value
 
-            # Check it exists visits and last_visit attributes on session
-            self.assertIsNotNone(self.client.session['visits'])
-            self.assertIsNotNone(self.client.session['last_visit'])
+            # Check the visits are counted in the signed cookie, not in the session
+            self.assertEquals(self.client.session.get('visits'), None)
+            visits, last_visit_day = signing.get_cookie_signer(
+                salt=VISITS_COOKIE + VISITS_SALT).unsign(cookie).split(':')
 
-            # Check last visit time is within 0.1 second interval from now
-            self.assertAlmostEqual(datetime.now(),
-                datetime.strptime(session['last_visit'], "%Y-%m-%d %H:%M:%S.%f"), delta=timedelta(seconds=0.1))
+            # Check last visit day is today
+            self.assertEquals(int(last_visit_day), epoch_day())
 
-            # Get last visit time subtracted by one day
-            last_visit = datetime.now() - timedelta(days=1)
+            # Set last visit to a day ago
+            self.client.cookies[VISITS_COOKIE] = visits_cookie_value(int(visits), epoch_day() - 1)
 
-            # Set last visit to a day ago and save
-            session['last_visit'] = str(last_visit)
-            session.save()
+            # Check if the visits number in the cookie is being incremented and it's correct
+            self.assertEquals(int(visits), i + 1)
 
-            # Check if the visits number in session is being incremented and it's correct
-            self.assertEquals(session['visits'], i + 1)
+    def test_visits_are_carried_over_from_the_session(self):
+        # Store visits in the session, as they were before the visits cookie
+        session = SessionStore()
+        session['visits'] = 5
+        session['last_visit'] = str(datetime.now() - timedelta(days=1))
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        # Access index and check the count went on from the session
+        response = self.client.get(reverse('index'))
+        self.assertIn('visits: 6', response.content)
+        self.assertIn(VISITS_COOKIE, response.cookies)
 
 class Chapter11ViewTests(TestCase):
     def test_index_shows_number_of_visits(self):
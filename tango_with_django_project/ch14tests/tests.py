@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.cache import cache
 import test_utils
 from django.template import Context, Template
 from rango.models import Category
@@ -52,3 +54,26 @@ class Chapter14ViewTests(TestCase):
         # Check if no categories message is displayed in sidebar
         self.assertContains(response, 'There are no category present.')
 
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_sidebar_is_cached_until_categories_change(self):
+        cache.clear()
+        categories = test_utils.create_categories()
+        template = Template('{% load rango_extras %} {% get_category_list category %}')
+
+        # Render the sidebar once, then check it comes from the cache
+        template.render(Context({'category': categories[0]}))
+        with self.assertNumQueries(0):
+            rendered = template.render(Context({'category': categories[1]}))
+
+        # Check only the category passed in is highlighted
+        self.assertIn('<li class="active"><a href="' + reverse('category', args=[categories[1].slug]) + '">', rendered)
+        self.assertEquals(rendered.count('class="active"'), 1)
+
+        # Add and remove categories and check the sidebar follows
+        new_category = Category(name="New Category")
+        new_category.save()
+        categories[0].delete()
+        rendered = template.render(Context({'category': None}))
+        self.assertIn(new_category.name, rendered)
+        self.assertNotIn(reverse('category', args=[categories[0].slug]), rendered)
+        self.assertNotIn('class="active"', rendered)
@@ -1,9 +1,21 @@
 import sys
 
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from StringIO import StringIO
 from selenium import webdriver
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 import os
+import shutil
+import tempfile
+import httplib
+import json
+import socket
+import threading
+import time
+import mock
 from django.conf import settings
 from selenium.common.exceptions import NoSuchElementException, ElementNotVisibleException
 from selenium.webdriver.common.by import By
@@ -13,7 +25,32 @@ from selenium.webdriver.common.keys import Keys
 
 import populate_rango
 import test_utils
-from rango.models import Page
+from rango.models import Category, CategoryLike, CategoryViewShard, Page
+from rango.counters import category_views, click_buffer
+from rango.counters import flush_all, record_category_like
+from rango.counters import WriteBehindBuffer
+from rango import counters
+from rango.activity import activity_buffer, activity_totals, compact, top_activity
+from rango.models import ActivityBucket, TrendingScore
+from rango.trending import ERA_HALF_LIVES, bump, era_weight, trending_buffer
+from rango.models import UniqueVisitorSketch
+from rango.visitors import unique_visitors
+from rango import visitors
+from rango import clicklog
+from rango.search import SearchBackend, run_query
+from rango.breaker import search_breaker, search_rate_limit
+from rango.fanout import fan_out
+from rango.jsonstream import iter_items
+from rango import textindex
+from rango.searchcache import search_cache
+from rango.searchclient import SearchClient, SearchError
+from rango.suggest import category_suggestions
+from rango.singleflight import SingleFlight, SingleFlightError, SingleFlightTimeout
+from rango.visits import VISITS_COOKIE, epoch_day, visits_cookie_value
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from datetime import timedelta
 from django.core.urlresolvers import reverse, NoReverseMatch
 
 class Chapter16ViewTests(TestCase):
@@ -30,6 +67,61 @@ class Chapter16ViewTests(TestCase):
             # Check it has the correct number of views
             self.assertContains(response, 'Category views: ' + str(i))
 
+    def test_category_page_answers_conditional_requests(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+        url = reverse('category', args=[categories[0].slug])
+
+        # The page comes with validators
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # Asking again with them gets a 304, and the view is still counted
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(category_views(Category.objects.get(id=categories[0].id)), 3)
+
+        # Adding a page changes the page, and so does clicking on one
+        Page(category=categories[0], title="New Page", url="http://www.newpage.com").save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New Page')
+        etag = response['ETag']
+        self.client.get(reverse('goto') + '?page_id=' + str(Page.objects.get(title="New Page").id))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
+        # Logged in users have their own copy
+        test_utils.create_user()
+        self.client.login(username='testuser', password='test1234')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 200)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_category_etag_follows_the_sidebar_and_trending_order(self):
+        cache.clear()
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+        url = reverse('category', args=[categories[0].slug])
+
+        # A new category shows in the sidebar of every category page
+        etag = self.client.get(url)['ETag']
+        Category(name='Sidebar Category').save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Sidebar Category')
+
+        # And a page going up the trending order changes the trending page
+        url += '?order=trending'
+        etag = self.client.get(url)['ETag']
+        era, weight = era_weight()
+        bump(TrendingScore.PAGE, pages[0].id, era, weight)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['pages'][0], pages[0])
+
     def test_count_page_views(self):
         #Create categories and 2 pages for category 1 with 0 views
         categories = test_utils.create_categories()
@@ -133,6 +225,981 @@ class Chapter16ViewTests(TestCase):
         # Assert it was redirected to edit profile
         self.assertRedirects(response, reverse('edit_profile'))
 
+@override_settings(RANGO_COUNTER_FLUSH_INTERVAL=60)
+class Chapter16CounterTests(TestCase):
+    def setUp(self):
+        # Start the flush intervals afresh
+        click_buffer.drain()
+        activity_buffer.drain()
+        trending_buffer.drain()
+        flush_all()
+        # Sketches cached by earlier tests belong to rolled back rows, whose
+        # ids are given out again
+        visitors.reset()
+
+    def tearDown(self):
+        # Do not leave buffered clicks behind for the next test
+        click_buffer.drain()
+        activity_buffer.drain()
+        trending_buffer.drain()
+        visitors.reset()
+
+    def test_page_clicks_are_buffered(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        page = test_utils.create_pages(categories)[0]
+
+        # Access the page 3 times
+        for i in xrange(0, 3):
+            self.client.get(reverse('goto') + '?page_id=' + str(page.id))
+
+        # Check the clicks have not been written yet, but the category page shows them
+        self.assertEquals(Page.objects.get(id=page.id).views, page.views)
+        response = self.client.get(reverse('category', args=[categories[0].slug]))
+        self.assertContains(response, '(' + str(page.views + 3) + ' views)')
+
+        # Check the pages are still in most viewed order
+        self.assertEquals(response.context['pages'][0], page)
+
+    @mock.patch('rango.counters.logger')
+    def test_clicks_are_kept_when_writing_them_fails(self, logger):
+        categories = test_utils.create_categories()
+        page = test_utils.create_pages(categories)[0]
+
+        # Writing the click out fails, but the visitor is still sent on
+        with self.settings(RANGO_COUNTER_FLUSH_INTERVAL=0):
+            with mock.patch.object(click_buffer, 'write', side_effect=DatabaseError('locked')):
+                response = self.client.get(reverse('goto') + '?page_id=' + str(page.id))
+        self.assertRedirects(response, page.url, fetch_redirect_response=False)
+        self.assertTrue(logger.exception.called)
+
+        # And the click is written out by the next flush
+        self.assertEquals(click_buffer.pending(page.id), 1)
+        flush_all()
+        self.assertEquals(Page.objects.get(id=page.id).views, page.views + 1)
+
+    def test_flush_counters_writes_buffered_clicks(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+
+        # Access two pages
+        self.client.get(reverse('goto') + '?page_id=' + str(pages[0].id))
+        self.client.get(reverse('goto') + '?page_id=' + str(pages[3].id))
+        self.client.get(reverse('goto') + '?page_id=' + str(pages[3].id))
+
+        # Drain the buffer
+        call_command('flush_counters', stdout=StringIO())
+
+        # Check the clicks were written and nothing is left in the buffer
+        self.assertEquals(Page.objects.get(id=pages[0].id).views, pages[0].views + 1)
+        self.assertEquals(Page.objects.get(id=pages[3].id).views, pages[3].views + 2)
+        self.assertEquals(click_buffer.pending(pages[3].id), 0)
+
+    @override_settings(RANGO_COUNTER_FLUSH_INTERVAL=0.1)
+    def test_buffers_are_written_out_when_idle(self):
+        written = []
+
+        class RecordingBuffer(WriteBehindBuffer):
+            name = 'recording'
+
+            def write(self, batch):
+                written.append(dict(batch))
+
+        # The other counters would be flushed on the flusher's own connection,
+        # which does not see the test database
+        with mock.patch.object(counters, '_counters', []):
+            buffer = RecordingBuffer()
+
+            # Two clicks and then none, which used to leave them in the buffer
+            buffer.add('page')
+            buffer.add('page')
+            for i in xrange(0, 30):
+                if written:
+                    break
+                time.sleep(0.1)
+
+        # Check the background thread wrote them out together
+        self.assertEquals(written, [{'page': 2}])
+        self.assertEquals(buffer.pending('page'), 0)
+
+    def test_flush_counters_asks_servers_for_their_buffers(self):
+        written = []
+
+        class RecordingBuffer(WriteBehindBuffer):
+            name = 'recording'
+
+            def write(self, batch):
+                written.append(dict(batch))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # Let a flusher left running by an earlier test stop
+        with self.settings(RANGO_COUNTER_FLUSH_INTERVAL=0):
+            for i in xrange(0, 30):
+                if counters._flusher is None:
+                    break
+                time.sleep(0.1)
+
+        with mock.patch.object(counters, '_counters', []):
+            with self.settings(RANGO_COUNTER_PID_DIR=directory):
+                buffer = RecordingBuffer()
+
+                # A click leaves the pid of this process for flush_counters
+                buffer.add('page')
+                self.assertEquals(os.listdir(directory), [str(os.getpid())])
+
+                # Which signals it, well before the flush interval has passed
+                out = StringIO()
+                call_command('flush_counters', timeout=5, stdout=out)
+
+        # Check the background thread wrote the click out for the command
+        self.assertEquals(written, [{'page': 1}])
+        self.assertIn('Process %d wrote out its buffers' % os.getpid(), out.getvalue())
+
+    def test_category_views_are_sharded_and_rolled_up(self):
+        #Create categories
+        categories = test_utils.create_categories()
+
+        #Access a category 20 times
+        for i in xrange(0, 20):
+            self.client.get(reverse('category', args=[categories[0].slug]))
+
+        # Check the views went to the shards, not to the category row
+        self.assertEquals(Category.objects.get(id=categories[0].id).views, 0)
+        self.assertLessEqual(CategoryViewShard.objects.filter(category=categories[0]).count(), 8)
+
+        # Fold the shards back into the category
+        call_command('flush_counters', stdout=StringIO())
+
+        # Check the category holds all views and the live total did not change
+        self.assertEquals(Category.objects.get(id=categories[0].id).views, 20)
+        response = self.client.get(reverse('category', args=[categories[0].slug]))
+        self.assertContains(response, 'Category views: 21')
+
+        # Once the flush interval has passed, the next view folds the shards by itself
+        with self.settings(RANGO_COUNTER_FLUSH_INTERVAL=0):
+            self.client.get(reverse('category', args=[categories[0].slug]))
+        self.assertEquals(Category.objects.get(id=categories[0].id).views, 22)
+        self.assertEquals(CategoryViewShard.objects.filter(category=categories[0], count__gt=0).count(), 0)
+
+    def test_clicks_are_rolled_up_by_hour_and_compacted(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+        now = timezone.now()
+
+        # Access page 1 three times and page 2 once, then write the buffers out
+        for i in xrange(0, 3):
+            self.client.get(reverse('goto') + '?page_id=' + str(pages[0].id))
+        self.client.get(reverse('goto') + '?page_id=' + str(pages[1].id))
+        call_command('flush_counters', stdout=StringIO())
+
+        # Check the clicks are in one hourly bucket per page
+        buckets = ActivityBucket.objects.filter(kind=ActivityBucket.PAGE_CLICKS)
+        self.assertEquals(buckets.filter(granularity=ActivityBucket.HOUR).count(), 2)
+        self.assertEquals(activity_totals(ActivityBucket.PAGE_CLICKS, now - timedelta(hours=1)),
+                          {pages[0].id: 3, pages[1].id: 1})
+
+        # Compact as if a week had passed and check the counts moved to daily buckets
+        compact(now + timedelta(days=7))
+        self.assertEquals(buckets.filter(granularity=ActivityBucket.HOUR).count(), 0)
+        self.assertEquals(buckets.filter(granularity=ActivityBucket.DAY).count(), 2)
+        self.assertEquals(top_activity(ActivityBucket.PAGE_CLICKS, now - timedelta(days=1)),
+                          [(pages[0].id, 3), (pages[1].id, 1)])
+
+    def test_trending_order_prefers_recent_clicks(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+
+        # Page 1 got 3 clicks three days ago
+        era, weight = era_weight(timezone.now() - timedelta(days=3))
+        bump(TrendingScore.PAGE, pages[0].id, era, 3 * weight)
+
+        # Page 2 gets a click now
+        self.client.get(reverse('goto') + '?page_id=' + str(pages[1].id))
+        call_command('flush_counters', stdout=StringIO())
+
+        # Check page 2 is trending above page 1 on the category page and the index
+        response = self.client.get(reverse('category', args=[categories[0].slug]) + '?order=trending')
+        self.assertEquals(response.context['pages'][0], pages[1])
+        self.assertEquals(response.context['pages'][1], pages[0])
+
+        response = self.client.get(reverse('index') + '?order=trending')
+        self.assertEquals(list(response.context['pages'][:2]), [pages[1], pages[0]])
+        self.assertEquals(len(response.context['pages']), 5)
+
+    def test_trending_bumps_from_an_earlier_era(self):
+        scores = TrendingScore.objects.filter(kind=TrendingScore.PAGE, object_id=1)
+
+        # A click in era 10 is written out before one from era 9
+        bump(TrendingScore.PAGE, 1, 10, 1.0)
+        bump(TrendingScore.PAGE, 1, 9, 2.0 ** ERA_HALF_LIVES)
+
+        # Check the earlier click was scaled into era 10
+        self.assertEquals(list(scores.values_list('era', 'score')), [(10, 2.0)])
+
+    def test_category_counts_unique_visitors(self):
+        #Create categories
+        categories = test_utils.create_categories()
+
+        # Two visitors access a category 5 times each
+        for i in xrange(0, 5):
+            self.client.get(reverse('category', args=[categories[0].slug]), REMOTE_ADDR='10.0.0.1')
+            response = self.client.get(reverse('category', args=[categories[0].slug]), REMOTE_ADDR='10.0.0.2')
+
+        # Check there are 10 views, but only 2 unique visitors in one sketch for today
+        self.assertContains(response, 'Category views: 10')
+        self.assertContains(response, 'Unique visitors in the last 30 days: 2')
+        self.assertEquals(UniqueVisitorSketch.objects.filter(object_id=categories[0].id).count(), 1)
+        self.assertEquals(unique_visitors(UniqueVisitorSketch.CATEGORY, categories[1].id), 0)
+
+    @override_settings(RANGO_VISITOR_SKETCHES=2)
+    def test_only_recent_visitor_sketches_are_kept(self):
+        #Create categories
+        categories = test_utils.create_categories()
+
+        # Visit three categories, then the first again
+        for category in categories[:3] + categories[:1]:
+            self.client.get(reverse('category', args=[category.slug]), REMOTE_ADDR='10.0.0.1')
+        self.client.get(reverse('category', args=[categories[1].slug]), REMOTE_ADDR='10.0.0.2')
+
+        # Check only the two most recently visited sketches are in memory
+        self.assertEquals(list(visitors._sketches),
+                          [(UniqueVisitorSketch.CATEGORY, categories[0].id),
+                           (UniqueVisitorSketch.CATEGORY, categories[1].id)])
+
+        # But nothing was lost with the one dropped
+        self.assertEquals(unique_visitors(UniqueVisitorSketch.CATEGORY, categories[0].id), 1)
+        self.assertEquals(unique_visitors(UniqueVisitorSketch.CATEGORY, categories[1].id), 2)
+
+    def test_click_log_rebuilds_page_views(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+
+        with self.settings(RANGO_CLICK_LOG_DIR=log_dir, RANGO_CLICK_LOG_SEGMENT_SIZE=64,
+                           RANGO_CLICK_LOG_FSYNC_INTERVAL=0):
+            # Access page 1 five times and the first category twice
+            for i in xrange(0, 5):
+                self.client.get(reverse('goto') + '?page_id=' + str(pages[0].id))
+            for i in xrange(0, 2):
+                self.client.get(reverse('category', args=[categories[0].slug]))
+            # Like the second category
+            test_utils.create_user()
+            self.client.login(username='testuser', password='test1234')
+            self.client.get(reverse('like_category'), {'category_id': categories[1].id})
+            clicklog.close_click_log()
+
+            # Check the log was split into segments and replays all events
+            self.assertGreater(len(clicklog.segments(log_dir)), 1)
+            counts = clicklog.replay(log_dir)
+            self.assertEquals(counts[(clicklog.PAGE_CLICK, pages[0].id)], 5)
+            self.assertEquals(counts[(clicklog.CATEGORY_VIEW, categories[0].id)], 2)
+            self.assertEquals(counts[(clicklog.CATEGORY_LIKE, categories[1].id)], 1)
+
+            # Check the counts are compared with the log, likes too
+            out = StringIO()
+            call_command('replay_clicklog', stdout=out)
+            self.assertIn('Category %d: 3 likes, 1 in log' % categories[1].id, out.getvalue())
+
+            # Rebuilding would lose the views counted before the log, so it has to be confirmed
+            self.assertRaises(CommandError, call_command, 'replay_clicklog', apply=True, stdout=StringIO())
+            self.assertEquals(Page.objects.get(id=pages[1].id).views, pages[1].views)
+
+            # Rebuild the counts from the log
+            call_command('replay_clicklog', apply=True, from_zero=True, stdout=StringIO())
+
+        # Check page views and likes now only hold the logged events
+        self.assertEquals(Page.objects.get(id=pages[0].id).views, 5)
+        self.assertEquals(Page.objects.get(id=pages[1].id).views, 0)
+        self.assertEquals(Category.objects.get(id=categories[0].id).views, 2)
+        self.assertEquals(Category.objects.get(id=categories[0].id).likes, 0)
+        self.assertEquals(Category.objects.get(id=categories[1].id).likes, 1)
+        self.assertEquals(CategoryLike.objects.filter(counted=False).count(), 0)
+
+    def test_users_can_like_a_category_only_once(self):
+        # Create categories and user, and log in
+        categories = test_utils.create_categories()
+        test_utils.create_user()
+        self.client.login(username='testuser', password='test1234')
+
+        # Like the first category twice
+        response = self.client.get(reverse('like_category'), {'category_id': categories[0].id})
+        self.assertEquals(response.content, str(categories[0].likes + 1))
+        response = self.client.get(reverse('like_category'), {'category_id': categories[0].id})
+        self.assertEquals(response.content, str(categories[0].likes + 1))
+
+        # Check the like is in the ledger but not yet in the category row
+        self.assertEquals(CategoryLike.objects.filter(category=categories[0]).count(), 1)
+        self.assertEquals(Category.objects.get(id=categories[0].id).likes, categories[0].likes)
+
+        # Fold the ledger into the category
+        call_command('flush_counters', stdout=StringIO())
+        self.assertEquals(Category.objects.get(id=categories[0].id).likes, categories[0].likes + 1)
+
+        # Check liking again still returns the same count
+        response = self.client.get(reverse('like_category'), {'category_id': categories[0].id})
+        self.assertEquals(response.content, str(categories[0].likes + 1))
+
+    @mock.patch('rango.counters.logger')
+    def test_likes_are_kept_when_counting_them_fails(self, logger):
+        categories = test_utils.create_categories()
+        test_utils.create_user()
+        self.client.login(username='testuser', password='test1234')
+
+        # Folding the likes fails, but the like is still taken and reported
+        with self.settings(RANGO_COUNTER_FLUSH_INTERVAL=0):
+            with mock.patch('rango.counters.category_leaderboard.refresh', side_effect=DatabaseError('locked')):
+                response = self.client.get(reverse('like_category'), {'category_id': categories[0].id})
+        self.assertEquals(response.content, str(categories[0].likes + 1))
+        self.assertTrue(logger.exception.called)
+
+        # And counted by the next flush
+        self.assertEquals(CategoryLike.objects.filter(counted=False).count(), 1)
+        flush_all()
+        self.assertEquals(Category.objects.get(id=categories[0].id).likes, categories[0].likes + 1)
+        self.assertEquals(flush_all()['category_likes'], 0)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class Chapter16CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    # Without the page cache, so the lists themselves are checked
+    @override_settings(RANGO_PAGE_CACHE_TIMEOUT=0)
+    def test_index_top_lists_come_from_the_cache(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+
+        # Access index once to fill the cache, then check the next access runs no queries
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertItemsEqual(response.context['categories'], Category.objects.order_by('-likes')[:5])
+        self.assertItemsEqual(response.context['pages'], Page.objects.order_by('-views')[:5])
+
+    def test_index_top_lists_follow_changes(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+        self.client.get(reverse('index'))
+
+        # Category 1 gets the most likes, category 10 is deleted and category 9 loses its likes
+        categories[0].likes = 100
+        categories[0].save()
+        categories[9].delete()
+        categories[8].likes = 0
+        categories[8].save()
+
+        # A page gets the most views through the click buffer
+        page = Page.objects.get(title="Page 1")
+        for i in xrange(0, 50):
+            self.client.get(reverse('goto') + '?page_id=' + str(page.id))
+
+        # Check the top lists match the database
+        response = self.client.get(reverse('index'))
+        self.assertEquals(list(response.context['categories']), list(Category.objects.order_by('-likes')[:5]))
+        self.assertEquals(response.context['categories'][0], categories[0])
+        self.assertEquals(list(response.context['pages']), list(Page.objects.order_by('-views')[:5]))
+        self.assertEquals(response.context['pages'][0], page)
+
+    def test_category_suggestions_come_from_memory(self):
+        category_suggestions.clear()
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        Category.objects.create(name='Python Frameworks', likes=5)
+
+        # Names and slugs match without regard to case, most liked first, without queries
+        names = lambda cats: [c.name for c in cats]
+        self.assertEquals(names(category_suggestions.suggest('category 1', 3)), ['Category 10', 'Category 1'])
+        with self.assertNumQueries(0):
+            self.assertEquals(names(category_suggestions.suggest('CATEGORY-1', 3)), ['Category 10', 'Category 1'])
+            self.assertEquals(names(category_suggestions.suggest('p')), ['Python Frameworks'])
+            response = self.client.get(reverse('suggest_category'), {'suggestion': 'cat', 'catid': categories[8].id})
+        self.assertEquals(names(response.context['cats']), ['Category %d' % i for i in xrange(10, 2, -1)])
+        self.assertContains(response, '<li class="active"><a href="/rango/category/category-9/">')
+
+        # Saves, deletes and counted likes are picked up
+        categories[0].name = 'Django'
+        categories[0].save()
+        categories[9].delete()
+        record_category_like(test_utils.create_user()[0], categories[1])
+        record_category_like(test_utils.create_user('other')[0], categories[1])
+        flush_all()
+        self.assertEquals(names(category_suggestions.suggest('d')), ['Django'])
+        self.assertEquals(names(category_suggestions.suggest('category 1')), [])
+        self.assertEquals(names(category_suggestions.suggest('category')),
+                          ['Category %d' % i for i in (9, 8, 7, 6, 5, 2, 4, 3)])
+
+        # And the changes of other processes once the category version changes
+        Category.objects.filter(id=categories[2].id).update(likes=100)
+        cache.clear()
+        self.assertEquals(names(category_suggestions.suggest('category', 1)), ['Category 3'])
+
+    def test_misspelt_category_suggestions(self):
+        category_suggestions.clear()
+        for name, likes in (('Python', 3), ('Python Frameworks', 5), ('Django', 1), ('Pyramid', 9)):
+            Category.objects.create(name=name, likes=likes)
+
+        # Names within a typo for every three letters, closest first, then most liked
+        names = lambda cats: [c.name for c in cats]
+        self.assertEquals(names(category_suggestions.similar('pyhton')), ['Python Frameworks', 'Python'])
+        self.assertEquals(names(category_suggestions.similar('djnago')), ['Django'])
+        self.assertEquals(names(category_suggestions.similar('pyt')), ['Python Frameworks', 'Python', 'Pyramid'])
+        self.assertEquals(names(category_suggestions.similar('pyr')), ['Pyramid', 'Python Frameworks', 'Python'])
+        self.assertEquals(category_suggestions.similar('jv'), [])
+        self.assertEquals(category_suggestions.similar('haskell'), [])
+
+        # The sidebar filter falls back on them after the names starting with what was typed
+        response = self.client.get(reverse('suggest_category'), {'suggestion': 'Pytn', 'catid': ''})
+        self.assertEquals(names(response.context['cats']), ['Python Frameworks', 'Python'])
+        response = self.client.get(reverse('suggest_category'), {'suggestion': 'Pyt', 'catid': ''})
+        self.assertEquals(names(response.context['cats']), ['Python Frameworks', 'Python', 'Pyramid'])
+
+    def test_category_suggestions_as_json(self):
+        category_suggestions.clear()
+        #Create categories and pages
+        categories = test_utils.create_categories()
+
+        # More than 8 categories start with "cat", so the list is not complete
+        response = self.client.get(reverse('suggest_categories'), {'prefix': 'cat'})
+        data = json.loads(response.content)
+        self.assertEquals(data['categories'][0], [categories[9].id, 'Category 10', 'category-10'])
+        self.assertEquals(len(data['categories']), 8)
+        self.assertFalse(data['complete'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        # Here it is, and misspelt names fill it up
+        data = json.loads(self.client.get(reverse('suggest_categories'), {'prefix': 'category 1'}).content)
+        self.assertEquals([c[1] for c in data['categories']], ['Category 10', 'Category 1'])
+        self.assertTrue(data['complete'])
+        self.assertEquals(len(data['similar']), 6)
+
+        # An unchanged list is not sent again
+        etag = response['ETag']
+        response = self.client.get(reverse('suggest_categories'), {'prefix': 'cat'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        categories[9].delete()
+        response = self.client.get(reverse('suggest_categories'), {'prefix': 'cat'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class Chapter16PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_with_their_own_visit_count(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+
+        # A visitor coming back on a new day fills the cache
+        self.client.cookies[VISITS_COOKIE] = visits_cookie_value(3, epoch_day() - 1)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'visits: 4')
+
+        # A new visitor gets the cached page without any queries, with their own count
+        self.client.cookies.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertTemplateNotUsed(response, 'rango/index.html')
+        self.assertContains(response, 'visits: 1')
+        self.assertContains(response, categories[0].name)
+        self.assertIn(VISITS_COOKIE, response.cookies)
+
+        # The about page too
+        self.client.get(reverse('about'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('about'))
+        self.assertContains(response, 'visits: 1')
+
+    def test_page_cache_ignores_query_strings_the_views_do_not_read(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+        self.client.get(reverse('index'))
+
+        # Tracking parameters and cache busters get the cached page
+        for query in ('?utm_source=mail', '?123', '?order=liked'):
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('index') + query)
+            self.assertTemplateNotUsed(response, 'rango/index.html')
+
+        # But the trending order is a page of its own
+        response = self.client.get(reverse('index') + '?order=trending&utm_source=mail')
+        self.assertTemplateUsed(response, 'rango/index.html')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index') + '?utm_source=feed&order=trending')
+
+    def test_cached_category_page_shows_live_view_count(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+        url = reverse('category', args=[categories[0].slug])
+
+        # Every view is still counted and shown on the cached page
+        for i in xrange(1, 4):
+            response = self.client.get(url)
+            self.assertContains(response, 'Category views: ' + str(i))
+        self.assertTemplateNotUsed(response, 'rango/category.html')
+        self.assertContains(response, 'Page 1')
+
+    def test_page_cache_follows_changes_and_skips_logged_in_users(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+        self.client.get(reverse('index'))
+        self.client.get(reverse('category', args=[categories[0].slug]))
+
+        # Adding a category or a page drops the cached pages
+        Category(name="New Category").save()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'New Category')
+        Page(category=categories[0], title="New Page", url="http://www.newpage.com").save()
+        response = self.client.get(reverse('category', args=[categories[0].slug]))
+        self.assertContains(response, 'New Page')
+
+        # Logged in users never get the cached page
+        test_utils.create_user()
+        self.client.login(username='testuser', password='test1234')
+        for i in xrange(0, 2):
+            response = self.client.get(reverse('category', args=[categories[0].slug]))
+            self.assertTemplateUsed(response, 'rango/category.html')
+            self.assertContains(response, 'Add a Page')
+
+class SlowBackend(SearchBackend):
+    def search(self, query, offset, limit):
+        time.sleep(2)
+        return [{'title': 'Slow', 'link': 'http://www.slow.com', 'summary': ''}]
+
+class Chapter16SearchTests(TestCase):
+    def setUp(self):
+        search_cache.clear()
+        search_breaker.reset()
+        search_rate_limit.reset()
+
+    def tearDown(self):
+        search_cache.clear()
+        search_breaker.reset()
+        search_rate_limit.reset()
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_search_results_are_cached(self, fetch_results):
+        fetch_results.return_value = [{'title': 'Python', 'link': 'http://www.python.org', 'summary': 'Python'}]
+
+        # The same search, however it is typed, goes to Bing once
+        self.assertEquals(run_query('Python'), fetch_results.return_value)
+        self.assertEquals(run_query('  python '), fetch_results.return_value)
+        self.assertEquals(fetch_results.call_count, 1)
+        self.assertEquals(search_cache.info()['hits'], 1)
+        self.assertEquals(search_cache.info()['misses'], 1)
+
+        # Other pages of results are searched for separately
+        run_query('Python', offset=10)
+        self.assertEquals(fetch_results.call_count, 2)
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_failed_searches_are_cached_briefly(self, fetch_results):
+        fetch_results.side_effect = SearchError('timed out')
+        self.assertEquals(run_query('Python'), [])
+        self.assertEquals(run_query('Python'), [])
+        self.assertEquals(fetch_results.call_count, 1)
+        self.assertEquals(search_cache.info()['negative_hits'], 1)
+
+        # Without a negative timeout they are tried again
+        with self.settings(RANGO_SEARCH_CACHE_NEGATIVE_TIMEOUT=0):
+            search_cache.clear()
+            run_query('Django')
+            run_query('Django')
+        self.assertEquals(fetch_results.call_count, 3)
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_concurrent_searches_share_one_call(self, fetch_results):
+        # Bing answers once all the searches are waiting
+        started = threading.Event()
+        release = threading.Event()
+        def slow_fetch(*args):
+            started.set()
+            release.wait(5)
+            return [{'title': 'Python', 'link': 'http://www.python.org', 'summary': 'Python'}]
+        fetch_results.side_effect = slow_fetch
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(run_query('Python'))) for i in xrange(5)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEquals(fetch_results.call_count, 1)
+        self.assertEquals(len(results), 5)
+        self.assertTrue(all(result[0]['title'] == 'Python' for result in results))
+
+    def test_single_flight_errors_and_timeouts(self):
+        flight = SingleFlight('test')
+        release = threading.Event()
+        def failing():
+            release.wait(5)
+            raise ValueError('failed')
+
+        # Everyone waiting gets the error
+        errors = []
+        def call():
+            try:
+                flight.do('key', failing)
+            except ValueError, e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for i in xrange(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEquals(len(errors), 3)
+
+        # Waiters give up after the timeout
+        release.clear()
+        leader = threading.Thread(target=lambda: flight.do('key', release.wait))
+        leader.start()
+        time.sleep(0.1)
+        self.assertRaises(SingleFlightTimeout, flight.do, 'key', lambda: None, timeout=0.1)
+        release.set()
+        leader.join(5)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_single_flight_across_processes(self):
+        cache.clear()
+        flight = SingleFlight('test')
+        lock_key, outcome_key = flight.shared_keys('key')
+
+        # Another process holds the lock, then leaves its result
+        cache.add(lock_key, True)
+        timer = threading.Timer(0.1, lambda: cache.set(outcome_key, (None, 'shared')))
+        timer.start()
+        self.assertEquals(flight.do('key', lambda: 'own', shared=True), 'shared')
+        timer.join()
+
+        # Or its error
+        cache.set(outcome_key, ('ValueError: failed', None))
+        self.assertRaises(SingleFlightError, flight.do, 'key', lambda: 'own', shared=True)
+
+        # Once nobody holds the lock, the call is made here
+        cache.clear()
+        self.assertEquals(flight.do('key', lambda: 'own', shared=True), 'own')
+        self.assertIsNone(cache.get(lock_key))
+
+    @mock.patch('rango.searchclient.httplib.HTTPSConnection')
+    def test_search_client_reuses_connections(self, HTTPSConnection):
+        response = HTTPSConnection.return_value.getresponse.return_value
+        response.status, response.will_close = 200, False
+        response.read.return_value = '{}'
+        client = SearchClient('search.example.com', connect_timeout=1, read_timeout=2)
+
+        # One connection, with the timeouts, does both requests
+        self.assertEquals(client.get('/a'), '{}')
+        self.assertEquals(client.get('/b'), '{}')
+        HTTPSConnection.assert_called_once_with('search.example.com', timeout=1)
+        HTTPSConnection.return_value.sock.settimeout.assert_called_with(2)
+        self.assertEquals(client.info()['connections'], 1)
+        self.assertEquals(client.info()['reused'], 1)
+        self.assertEquals(client.info()['idle'], 1)
+
+        # A kept connection the server closed is replaced
+        HTTPSConnection.return_value.getresponse.side_effect = [httplib.BadStatusLine(''), response]
+        self.assertEquals(client.get('/c'), '{}')
+        self.assertEquals(client.info()['connections'], 2)
+
+        # Errors are reported as SearchError
+        HTTPSConnection.return_value.getresponse.side_effect = None
+        response.status = 503
+        self.assertRaises(SearchError, client.get, '/d')
+        HTTPSConnection.return_value.getresponse.side_effect = socket.timeout('timed out')
+        self.assertRaises(SearchError, client.get, '/e')
+        self.assertEquals(client.info()['errors'], 2)
+
+    def test_search_responses_are_parsed_as_they_arrive(self):
+        document = StringIO('{"d": {"__next": "x", "meta": {"results": [1]}, "results": [' +
+                            '{"Title": "One", "Url": "http://one.com", "Thumbnail": {"Width": 100}}, ' +
+                            '{"Title": "Two", "Url": "http://two.com"}, ' + ', '.join(['{"Title": "More"}'] * 1000) +
+                            ']}}')
+
+        # Only the wanted fields of the wanted items are read, a chunk at a time
+        items = iter_items(document, ('d', 'results'), ('Title', 'Url'), chunk_size=16)
+        self.assertEquals(items.next(), {'Title': 'One', 'Url': 'http://one.com'})
+        self.assertEquals(items.next(), {'Title': 'Two', 'Url': 'http://two.com'})
+        self.assertLess(document.tell(), 200)
+
+        # Missing paths give nothing, broken documents raise ValueError
+        self.assertEquals(list(iter_items(StringIO('{"d": {"count": 0}}'), ('d', 'results'))), [])
+        self.assertEquals(list(iter_items(StringIO('{"d": {"results": [10, 20]}}'), ('d', 'results'), chunk_size=1)),
+                          [10, 20])
+        self.assertRaises(ValueError, list, iter_items(StringIO('{"d": {"results": [{"Ti'), ('d', 'results')))
+        self.assertRaises(ValueError, list, iter_items(StringIO('{"d": {"results": [1 2]}}'), ('d', 'results')))
+
+        # Numbers and strings cut by the end of a chunk are read whole, and items other than objects are kept
+        document = '{"skip": ["a\\"]", {"b": [1]}], "d": {"results": [-25.5e1, "x\\"y", {"Title": 1, "Url": 2}]}}'
+        for chunk_size in xrange(1, 10):
+            self.assertEquals(list(iter_items(StringIO(document), ('d', 'results'), ('Title',), chunk_size)),
+                              [-255.0, 'x"y', {'Title': 1}])
+
+    def test_search_backends(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+
+        # The local backend searches categories and pages
+        with self.settings(RANGO_SEARCH_BACKEND='local'):
+            results = run_query('Category 1', results_per_page=5)
+        self.assertEquals(len(results), 5)
+        self.assertEquals(results[0]['link'], reverse('category', args=[categories[0].slug]))
+
+        # The fixture backend replays recorded results
+        directory = tempfile.mkdtemp()
+        try:
+            with self.settings(RANGO_SEARCH_BACKEND='local', RANGO_SEARCH_FIXTURE=os.path.join(directory, 's.json')):
+                call_command('record_search_fixture', 'Page 1', backend='local', stdout=StringIO())
+                search_cache.clear()
+                results = run_query('page 1', backend='fixture')
+                self.assertEquals(results, run_query('Page 1'))
+                self.assertEquals(run_query('Page 2', backend='fixture'), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_full_text_index_follows_categories_and_pages(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        pages = test_utils.create_pages(categories)
+
+        # Words of titles, urls and category names are found, whole or started
+        # Matches in the title count most, then the most viewed come first
+        self.assertEquals([result['title'] for result in textindex.search('page 7')], ['Page 7', 'Page 14', 'Page 13'])
+        self.assertEquals([result['link'] for result in textindex.search('www.page12')], ['http://www.page12.com'])
+        self.assertEquals(textindex.search('categ')[0]['link'], reverse('category', args=[categories[0].slug]))
+        self.assertEquals(sorted(result['title'] for result in textindex.search('category 3')),
+                          ['Category 3', 'Page 3', 'Page 5', 'Page 6'])
+        self.assertEquals(textindex.search('"category*'), textindex.search('category'))
+        self.assertEquals(textindex.search('  '), [])
+
+        # Saving and deleting updates the index
+        categories[2].name = 'Flask'
+        categories[2].save()
+        self.assertEquals(len(textindex.search('flask')), 3)
+        pages[5].title = 'Bottle'
+        pages[5].save()
+        self.assertEquals([result['title'] for result in textindex.search('bottle')], ['Bottle'])
+        categories[2].delete()
+        self.assertEquals(textindex.search('flask'), [])
+        self.assertEquals(textindex.search('bottle'), [])
+
+        # The search page pages through the 18 pages left
+        response = self.client.get(reverse('site_search'), {'query': 'page', 'page': 2})
+        self.assertTemplateUsed(response, 'base.html')
+        self.assertContains(response, '<a class="navbar-brand" href="/rango/">Rango</a>', html=True)
+        self.assertContains(response, '<ul class="pager">', count=1)
+        self.assertContains(response, 'class="list-group-item"', count=8)
+        self.assertContains(response, 'Page 9')
+        self.assertContains(response, 'page=1')
+        self.assertNotContains(response, 'page=3')
+
+    def test_fan_out_merges_sources_within_the_deadline(self):
+        # Two sources answer straight away, one too late
+        with mock.patch('rango.search.LocalBackend.search') as local_search:
+            local_search.return_value = [{'title': 'Local', 'link': 'http://www.python.org/', 'summary': ''},
+                                         {'title': 'Local 2', 'link': '/rango/category/python/', 'summary': ''}]
+            with mock.patch('rango.bing_search.fetch_results') as fetch_results:
+                fetch_results.return_value = [{'title': 'Web', 'link': 'https://www.Python.org', 'summary': ''}]
+                start = time.time()
+                results = fan_out('Python', ('bing', 'local', 'ch16tests.tests.SlowBackend'), deadline=0.5)
+
+        # Results are taken in turn from each source, the same link only once
+        self.assertLess(time.time() - start, 1)
+        self.assertEquals([result['title'] for result in results], ['Web', 'Local 2'])
+        self.assertEquals(results[0]['source'], 'bing')
+
+    def test_fan_out_searches_our_pages_in_the_request(self):
+        #Create categories and pages
+        categories = test_utils.create_categories()
+        test_utils.create_pages(categories)
+
+        # Our pages are found on the request's connection, the only one that sees the test database,
+        # while the pool's threads close the connections they open
+        with mock.patch('rango.bing_search.fetch_results') as fetch_results:
+            fetch_results.return_value = [{'title': 'Web', 'link': 'http://www.page7.com/', 'summary': ''}]
+            with mock.patch('rango.fanout.connection') as pool_connection:
+                results = fan_out('page 7', ('bing', 'local'), deadline=5)
+
+        self.assertEquals([(result['title'], result['source']) for result in results],
+                          [('Web', 'bing'), ('Page 14', 'local'), ('Page 13', 'local')])
+        pool_connection.close.assert_called_once_with()
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_next_page_of_results_is_prefetched(self, fetch_results):
+        # Two full pages, then three more results
+        fetch_results.side_effect = lambda query, offset, count, source: \
+            [{'title': str(offset + i), 'link': 'http://www.%d.com' % (offset + i), 'summary': ''}
+             for i in xrange(count if offset < 20 else 3)]
+
+        results = fan_out('Python', ('bing',), page=1)
+        self.assertEquals(results[0]['title'], '0')
+        self.assertTrue(results.has_next)
+
+        # The second page is searched in the background
+        key = search_cache.key('bing', 'Python', 10, 10)
+        for i in xrange(100):
+            if search_cache.get(key) is not None:
+                break
+            time.sleep(0.01)
+        self.assertEquals(fetch_results.call_count, 2)
+
+        # And then comes from the cache, as does the third
+        results = fan_out('Python', ('bing',), page=2)
+        self.assertEquals(results[0]['title'], '10')
+        results = fan_out('Python', ('bing',), page=3, deadline=5)
+        self.assertEquals(results[0]['title'], '20')
+
+        # Which is the last one, so there is no next one to fetch
+        self.assertEquals(len(results), 3)
+        self.assertFalse(results.has_next)
+        time.sleep(0.1)
+        self.assertEquals(fetch_results.call_count, 3)
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_circuit_breaker_stops_searches_to_a_failing_bing(self, fetch_results):
+        fetch_results.return_value = [{'title': 'Python', 'link': 'http://www.python.org', 'summary': ''}]
+        with self.settings(RANGO_SEARCH_CACHE_TIMEOUT=0.1, RANGO_SEARCH_CACHE_NEGATIVE_TIMEOUT=0,
+                           RANGO_SEARCH_BREAKER_FAILURES=2, RANGO_SEARCH_BREAKER_RESET_TIMEOUT=0.2):
+            run_query('Python')
+            time.sleep(0.1)
+
+            # Two failures open the breaker
+            fetch_results.side_effect = SearchError('timed out')
+            run_query('Django')
+            run_query('Django')
+            self.assertEquals(search_breaker.info()['state'], 'open')
+
+            # And then Bing is not asked, but the stale results are served
+            self.assertEquals(run_query('Python'), fetch_results.return_value)
+            self.assertEquals(run_query('Django'), [])
+            self.assertEquals(fetch_results.call_count, 3)
+            self.assertEquals(search_breaker.info()['rejected'], 2)
+
+            # Until one search is let through, and succeeds
+            time.sleep(0.2)
+            fetch_results.side_effect = None
+            self.assertEquals(run_query('Django'), fetch_results.return_value)
+            self.assertEquals(search_breaker.info()['state'], 'closed')
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_failed_searches_serve_stale_results(self, fetch_results):
+        fetch_results.return_value = [{'title': 'Python', 'link': 'http://www.python.org', 'summary': ''}]
+        with self.settings(RANGO_SEARCH_CACHE_TIMEOUT=0.1):
+            run_query('Python')
+            time.sleep(0.1)
+
+            # Bing fails once the results have expired, so they are served stale
+            fetch_results.side_effect = SearchError('timed out')
+            self.assertEquals(run_query('Python'), fetch_results.return_value)
+            self.assertEquals(run_query('Python'), fetch_results.return_value)
+            self.assertEquals(fetch_results.call_count, 3)
+
+            # A search that never found anything is cached as empty
+            self.assertEquals(run_query('Django'), [])
+            self.assertEquals(run_query('Django'), [])
+            self.assertEquals(fetch_results.call_count, 4)
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_search_status_shows_breaker_and_rate_limit(self, fetch_results):
+        fetch_results.side_effect = SearchError('timed out')
+        with self.settings(RANGO_SEARCH_BREAKER_FAILURES=1, RANGO_SEARCH_RATE_LIMIT=0.01, RANGO_SEARCH_RATE_BURST=2):
+            run_query('Python')
+            run_query('Django')
+
+        # Only staff may see it
+        user = test_utils.create_user()[0]
+        self.client.login(username='testuser', password='test1234')
+        response = self.client.get(reverse('search_status'))
+        self.assertEquals(response.status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('search_status'))
+        status = json.loads(response.content)
+        self.assertEquals(status['breaker']['state'], 'open')
+        self.assertEquals(status['breaker']['rejected'], 1)
+        self.assertEquals(status['rate_limit']['allowed'], 1)
+        self.assertEquals(status['cache']['negative_hits'], 0)
+        self.assertIn('idle', status['connections'])
+        self.assertEquals(response['Cache-Control'], 'max-age=0')
+
+    @mock.patch('rango.bing_search.fetch_results')
+    def test_searches_are_rate_limited(self, fetch_results):
+        fetch_results.return_value = [{'title': 'Python', 'link': 'http://www.python.org', 'summary': ''}]
+        with self.settings(RANGO_SEARCH_RATE_LIMIT=0.01, RANGO_SEARCH_RATE_BURST=2):
+            for query in ('a', 'b', 'c', 'd'):
+                run_query(query)
+        self.assertEquals(fetch_results.call_count, 2)
+        self.assertEquals(search_rate_limit.info()['rejected'], 2)
+
+        # Going over the quota says nothing about Bing
+        self.assertEquals(search_breaker.info()['state'], 'closed')
+        self.assertEquals(search_breaker.info()['failures'], 0)
+
+    def test_search_cache_evicts_least_recently_used(self):
+        results = [{'title': 'x' * 100, 'link': '', 'summary': ''}]
+        with self.settings(RANGO_SEARCH_CACHE_MAX_ENTRIES=2):
+            search_cache.set('a', results)
+            search_cache.set('b', results)
+            search_cache.get('a')
+            search_cache.set('c', results)
+        self.assertIsNotNone(search_cache.get('a'))
+        self.assertIsNone(search_cache.get('b'))
+
+        # And keeps under the memory cap
+        with self.settings(RANGO_SEARCH_CACHE_MAX_BYTES=300):
+            for key in 'defg':
+                search_cache.set(key, results)
+        self.assertLessEqual(search_cache.info()['bytes'], 300)
+        self.assertEquals(search_cache.info()['entries'], 1)
+
+class Chapter16QueryPlanTests(TestCase):
+    # The queries run most often must be answered from an index, without
+    # reading whole tables or sorting their rows.
+    def assertUsesIndexes(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            self.assertNotIn('TEMP B-TREE', step, 'Sorts rows: %s' % plan)
+            self.assertFalse(step.startswith('SCAN') and 'USING' not in step, 'Scans a table: %s' % plan)
+
+    def test_hot_queries_use_indexes(self):
+        category = Category.objects.create(name='Python')
+
+        self.assertUsesIndexes(Category.objects.order_by('-likes')[:5])
+        self.assertUsesIndexes(Category.objects.order_by('-likes').values('id', 'likes', 'name', 'slug')[:20])
+        self.assertUsesIndexes(Page.objects.order_by('-views')[:5])
+        self.assertUsesIndexes(Page.objects.filter(category=category).order_by('-views'))
+        self.assertUsesIndexes(Category.objects.name_starts_with('Py'))
+
+    def test_name_prefix_ignores_case(self):
+        for name in ('Python', 'pyramid', 'PyPy', 'Django'):
+            Category.objects.create(name=name)
+        self.assertEquals(sorted(c.name for c in Category.objects.name_starts_with('PY')), ['PyPy', 'Python', 'pyramid'])
+        self.assertEquals(list(Category.objects.name_starts_with('pyth').values_list('name_lower', flat=True)),
+                          ['python'])
+
+
 class Chapter16LiveServerTestCase(StaticLiveServerTestCase):
     fixtures = ['admin_user.json']
 
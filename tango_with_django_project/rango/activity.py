@@ -0,0 +1,139 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from rango.counters import BATCH_SIZE, WriteBehindBuffer, group_by_amount
+from rango.models import ActivityBucket
+
+# Each bucket row binds 5 parameters, so stay well below SQLite's limit of 999.
+CREATE_BATCH_SIZE = 100
+
+
+def bucket_start(when, granularity):
+    # Truncate a datetime to the start of the hour, day or month it falls in.
+    when = when.replace(minute=0, second=0, microsecond=0)
+    if granularity == ActivityBucket.HOUR:
+        return when
+    when = when.replace(hour=0)
+    if granularity == ActivityBucket.DAY:
+        return when
+    return when.replace(day=1)
+
+
+def _add_to_buckets(granularity, counts):
+    groups = defaultdict(dict)
+    for (kind, object_id, start), amount in counts.items():
+        groups[(kind, start)][object_id] = amount
+
+    with transaction.atomic():
+        for (kind, start), amounts in groups.items():
+            buckets = ActivityBucket.objects.filter(kind=kind, granularity=granularity, start=start)
+
+            # Bump the buckets that already exist...
+            object_ids = amounts.keys()
+            existing = set()
+            for i in xrange(0, len(object_ids), BATCH_SIZE):
+                chunk = object_ids[i:i + BATCH_SIZE]
+                existing.update(buckets.filter(object_id__in=chunk).values_list('object_id', flat=True))
+
+            for amount, ids in group_by_amount(dict((id, amounts[id]) for id in existing)):
+                buckets.filter(object_id__in=ids).update(count=F('count') + amount)
+
+            # ...and create the rest in bulk.
+            new_buckets = [ActivityBucket(kind=kind, object_id=id, granularity=granularity,
+                                          start=start, count=amounts[id])
+                           for id in object_ids if id not in existing]
+            ActivityBucket.objects.bulk_create(new_buckets, batch_size=CREATE_BATCH_SIZE)
+
+
+def add_to_buckets(granularity, counts):
+    # Add counts, a dict of (kind, object_id, bucket start) -> amount,
+    # to the buckets of the given granularity.
+    try:
+        _add_to_buckets(granularity, counts)
+    except IntegrityError:
+        # Another process created some of the same buckets in the meantime.
+        # They exist now, so a second pass only has to update them.
+        _add_to_buckets(granularity, counts)
+
+
+class ActivityBuffer(WriteBehindBuffer):
+    # Buffers clicks and views, keyed by (kind, object_id, hour).
+    name = 'activity'
+
+    def write(self, batch):
+        add_to_buckets(ActivityBucket.HOUR, batch)
+
+
+activity_buffer = ActivityBuffer()
+
+
+def record_activity(kind, object_id):
+    activity_buffer.add((kind, object_id, bucket_start(timezone.now(), ActivityBucket.HOUR)))
+
+
+def _compact(source, target, cutoff):
+    with transaction.atomic():
+        buckets = ActivityBucket.objects.filter(granularity=source, start__lt=cutoff)
+
+        counts = defaultdict(int)
+        ids = []
+        for id, kind, object_id, start, count in buckets.values_list(
+                'id', 'kind', 'object_id', 'start', 'count').iterator():
+            counts[(kind, object_id, bucket_start(start, target))] += count
+            ids.append(id)
+
+        add_to_buckets(target, counts)
+        for i in xrange(0, len(ids), BATCH_SIZE):
+            ActivityBucket.objects.filter(id__in=ids[i:i + BATCH_SIZE]).delete()
+
+    return len(ids)
+
+
+def compact(now=None):
+    """
+    Folds hourly buckets older than RANGO_ACTIVITY_HOURLY_DAYS into daily
+    buckets, and daily buckets older than RANGO_ACTIVITY_DAILY_DAYS into
+    monthly buckets. Only whole days and months are folded, and only the
+    buckets that aged since the last run are touched.
+    Returns the number of buckets that were folded.
+    """
+    now = now or timezone.now()
+    hourly_days = getattr(settings, 'RANGO_ACTIVITY_HOURLY_DAYS', 2)
+    daily_days = getattr(settings, 'RANGO_ACTIVITY_DAILY_DAYS', 62)
+
+    folded = _compact(ActivityBucket.HOUR, ActivityBucket.DAY,
+                      bucket_start(now - timedelta(days=hourly_days), ActivityBucket.DAY))
+    folded += _compact(ActivityBucket.DAY, ActivityBucket.MONTH,
+                       bucket_start(now - timedelta(days=daily_days), ActivityBucket.MONTH))
+    return folded
+
+
+def _buckets_between(kind, start, end):
+    buckets = ActivityBucket.objects.filter(kind=kind, start__gte=start)
+    if end:
+        buckets = buckets.filter(start__lt=end)
+    return buckets
+
+
+def activity_totals(kind, start, end=None, object_ids=None):
+    # Counts per object for buckets starting in [start, end). Compacted
+    # buckets are only counted if they start inside the range, so the range
+    # is as precise as the buckets covering it.
+    buckets = _buckets_between(kind, start, end)
+    if object_ids is not None:
+        buckets = buckets.filter(object_id__in=object_ids)
+
+    return dict(buckets.values('object_id').annotate(total=Sum('count')).values_list('object_id', 'total'))
+
+
+def top_activity(kind, start, end=None, limit=5):
+    # The most clicked pages or viewed categories in [start, end),
+    # as a list of (object_id, count) pairs.
+    buckets = _buckets_between(kind, start, end)
+    totals = buckets.values('object_id').annotate(total=Sum('count')).order_by('-total')[:limit]
+    return [(row['object_id'], row['total']) for row in totals]
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class RangoConfig(AppConfig):
+    name = 'rango'
+
+    def ready(self):
+        # Connect the signal handlers that keep rango's caches up to date.
+        import rango.signals
+
+        # Let flush_counters ask this process to write out its buffers.
+        from rango.counters import install_flush_handler
+        install_flush_handler()
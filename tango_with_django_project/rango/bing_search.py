@@ -1,17 +1,33 @@
-import json
-import urllib, urllib2
-from keys import BING_API_KEY
+import base64
+import threading
+import urllib
+from django.conf import settings
+from rango import jsonstream
+from rango.searchclient import SearchClient, SearchError
 
-def run_query(search_terms):
-    # Specify the base
-    root_url = 'https://api.datamarket.azure.com/Bing/Search/'
-    source = 'Web'
+BING_HOST = 'api.datamarket.azure.com'
+RESULT_FIELDS = ('Title', 'Url', 'Description')
+
+_search_client = None
+_search_client_lock = threading.Lock()
+
+def get_search_client():
+    # The process-wide client for the Bing API, whose connections are kept
+    # open and shared by all the searches of the process.
+    global _search_client
+    with _search_client_lock:
+        if _search_client is None:
+            _search_client = SearchClient(BING_HOST,
+                                          getattr(settings, 'RANGO_SEARCH_POOL_SIZE', 4),
+                                          getattr(settings, 'RANGO_SEARCH_CONNECT_TIMEOUT', 3.0),
+                                          getattr(settings, 'RANGO_SEARCH_READ_TIMEOUT', 5.0))
+        return _search_client
 
-    # Specify how many results we wish to be returned per page.
-    # Offset specifies where in the results list to start from.
-    # With results_per_page = 10 and offset = 11, this would start from page 2.
-    results_per_page = 10
-    offset = 0
+
+def fetch_results(search_terms, offset, results_per_page, source='Web'):
+    # Specify the base
+    # The source is what to search: 'Web', 'News', ...
+    root_url = '/Bing/Search/'
 
     # Wrap quotes around our query terms as required by the Bing API.
     # The query we will then use is stored within variable query.
@@ -29,42 +45,40 @@ def run_query(search_terms):
 
     # Setup authentication with the Bing servers.
     # The username MUST be a blank string, and put in your API key!
+    # The key is only needed here, so the site runs without it.
+    try:
+        from keys import BING_API_KEY
+    except ImportError:
+        raise SearchError('Put your Bing API key in keys.py as BING_API_KEY')
+    # The credentials are sent with the request, saving the round trip to be asked for them.
     username = ''
-
-    # Create a 'password manager' which handles authentication for us.
-    password_mgr = urllib2.HTTPPasswordMgrWithDefaultRealm()
-    password_mgr.add_password(None, search_url, username, BING_API_KEY)
+    headers = {'Authorization': 'Basic ' + base64.b64encode('%s:%s' % (username, BING_API_KEY))}
 
     # Create our results list which we'll populate.
     results = []
 
+    # Connect to the server and parse the response as it arrives, keeping
+    # only the fields we use of each result and stopping at the last one
+    # we want.
     try:
-        # Prepare for connecting to Bing's servers.
-        handler = urllib2.HTTPBasicAuthHandler(password_mgr)
-        opener = urllib2.build_opener(handler)
-        urllib2.install_opener(opener)
-
-        # Connect to the server and read the response generated.
-        response = urllib2.urlopen(search_url).read()
-
-        # Convert the string response to a Python dictionary object.
-        json_response = json.loads(response)
-
-        # Loop through each page returned, populating out results list.
-        for result in json_response['d']['results']:
-            results.append({
-            'title': result['Title'],
-            'link': result['Url'],
-            'summary': result['Description']})
-
-    # Catch a URLError exception - something went wrong when connecting!
-    except urllib2.URLError, e:
-        print "Error when querying the Bing API: ", e
+        with get_search_client().open(search_url, headers) as response:
+            for result in jsonstream.iter_items(response, ('d', 'results'), RESULT_FIELDS):
+                if not isinstance(result, dict):
+                    continue
+                results.append({
+                'title': result.get('Title', ''),
+                'link': result.get('Url', ''),
+                'summary': result.get('Description', '')})
+                if len(results) >= results_per_page:
+                    break
+    except ValueError, e:
+        raise SearchError('Bing answered with invalid JSON: %s' % e)
 
     # Return the list of results to the calling function.
     return results
     
 def main():
+    from rango.search import run_query
     search_terms = raw_input('Search for:')
     results = run_query(search_terms)
     rank = 1
@@ -0,0 +1,145 @@
+import threading
+import time
+
+from django.conf import settings
+
+from rango.searchclient import SearchError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class SearchUnavailable(SearchError):
+    # The search was refused without asking the search service.
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a failing service. After RANGO_SEARCH_BREAKER_FAILURES
+    failures in a row the breaker opens, and calls fail straight away with
+    SearchUnavailable. After RANGO_SEARCH_BREAKER_RESET_TIMEOUT seconds it
+    is half-open: one call is let through, and closes the breaker if it
+    succeeds or opens it again if it fails.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self.stats = dict.fromkeys(('calls', 'failures', 'rejected', 'opened'), 0)
+
+    def _setting(self, name, default):
+        return getattr(settings, 'RANGO_SEARCH_BREAKER_' + name, default)
+
+    def _before(self):
+        # Decides whether a call may go ahead; True if it is the trial call.
+        with self._lock:
+            if self._state == OPEN and time.time() >= self._opened_at + self._setting('RESET_TIMEOUT', 30):
+                self._state = HALF_OPEN
+            if self._state == OPEN or (self._state == HALF_OPEN and self._trial_running):
+                self.stats['rejected'] += 1
+                raise SearchUnavailable('Searching is paused after %d failures.' % self._failures)
+            self.stats['calls'] += 1
+            trial = self._state == HALF_OPEN
+            self._trial_running = self._trial_running or trial
+            return trial
+
+    def _after(self, trial, failed):
+        # failed is None when the call says nothing about the service.
+        with self._lock:
+            if trial:
+                self._trial_running = False
+            if failed is None:
+                return
+            if not failed:
+                self._state = CLOSED
+                self._failures = 0
+                return
+            self.stats['failures'] += 1
+            self._failures += 1
+            if trial or (self._state == CLOSED and self._failures >= self._setting('FAILURES', 5)):
+                self._state = OPEN
+                self._opened_at = time.time()
+                self.stats['opened'] += 1
+
+    def call(self, func, *args):
+        # Calls func(*args), counting the SearchErrors it raises as failures.
+        # Refusals before reaching the service, and other errors, are not.
+        trial = self._before()
+        failed = None
+        try:
+            result = func(*args)
+            failed = False
+            return result
+        except SearchUnavailable:
+            raise
+        except SearchError:
+            failed = True
+            raise
+        finally:
+            self._after(trial, failed)
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+            for name in self.stats:
+                self.stats[name] = 0
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, state=self._state, consecutive_failures=self._failures)
+
+
+class TokenBucket(object):
+    """
+    Keeps searches within our quota: RANGO_SEARCH_RATE_LIMIT searches a
+    second on average, in bursts of up to RANGO_SEARCH_RATE_BURST. Searches
+    beyond that fail straight away with SearchUnavailable. Without a rate
+    limit every search goes ahead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._updated = 0
+        self.stats = dict.fromkeys(('allowed', 'rejected'), 0)
+
+    def _setting(self, name, default):
+        return getattr(settings, 'RANGO_SEARCH_RATE_' + name, default)
+
+    def take(self):
+        rate = self._setting('LIMIT', None)
+        burst = self._setting('BURST', 10)
+        with self._lock:
+            if rate:
+                # Refill for the time since the last search, up to the burst size.
+                now = time.time()
+                if self._tokens is None:
+                    self._tokens = burst
+                self._tokens = min(burst, self._tokens + (now - self._updated) * rate)
+                self._updated = now
+                if self._tokens < 1:
+                    self.stats['rejected'] += 1
+                    raise SearchUnavailable('Over the search rate limit of %s a second.' % rate)
+                self._tokens -= 1
+            self.stats['allowed'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._tokens = None
+            for name in self.stats:
+                self.stats[name] = 0
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, tokens=self._tokens)
+
+
+search_breaker = CircuitBreaker()
+search_rate_limit = TokenBucket()
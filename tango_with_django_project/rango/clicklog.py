@@ -0,0 +1,179 @@
+import atexit
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# Event types
+PAGE_CLICK = 1
+CATEGORY_VIEW = 2
+CATEGORY_LIKE = 3
+
+# Every record is a 4 byte length followed by the event: type, time,
+# object id and user id (0 for anonymous visitors).
+LENGTH = struct.Struct('>I')
+EVENT = struct.Struct('>BdII')
+
+
+class ClickLog(object):
+    """
+    Append-only log of click, view and like events, written to numbered
+    segment files in `directory`. A segment is closed once it grows past
+    `segment_size` bytes. Appends only go to the file buffer; a background
+    thread flushes and fsyncs at most every `fsync_interval` seconds, so the
+    request path never waits for the disk. Each process writes to its own
+    segments, named by creation time and process id.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._syncer = None
+
+    def _open_segment(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        name = '%013d-%d.log' % (int(time.time() * 1000), os.getpid())
+        self._file = open(os.path.join(self.directory, name), 'ab')
+
+    def _close_segment(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._dirty = False
+
+    def append(self, event, object_id, user_id=0, when=None):
+        payload = EVENT.pack(event, when or time.time(), object_id, user_id or 0)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(LENGTH.pack(len(payload)) + payload)
+            self._dirty = True
+            if self._file.tell() >= self.segment_size:
+                self._close_segment()
+
+        if self.fsync_interval:
+            self._start_syncer()
+        else:
+            self.sync()
+
+    def sync(self):
+        with self._lock:
+            if self._file is None or not self._dirty:
+                return
+            self._file.flush()
+            self._dirty = False
+            fileno = self._file.fileno()
+        # fsync outside the lock, so appends can carry on meanwhile.
+        try:
+            os.fsync(fileno)
+        except OSError:
+            # The segment was rotated and closed in the meantime,
+            # which already synced it.
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+
+    def _start_syncer(self):
+        if self._syncer is not None:
+            return
+        with self._lock:
+            if self._syncer is None:
+                self._syncer = threading.Thread(target=self._sync_forever, name='clicklog-sync')
+                self._syncer.daemon = True
+                self._syncer.start()
+
+    def _sync_forever(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+
+def segments(directory):
+    # Segment paths, oldest first.
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.log'))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segment(path):
+    """
+    Yields (event, time, object_id, user_id) tuples from a segment. The file
+    is memory-mapped and records are unpacked straight from the map, so no
+    data is copied. A record cut short by a crash ends the segment.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            while offset + LENGTH.size <= size:
+                length, = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                if length != EVENT.size or offset + length > size:
+                    break
+                yield EVENT.unpack_from(data, offset)
+                offset += length
+        finally:
+            data.close()
+
+
+def replay(directory):
+    # Counts events per (event type, object id) over all segments.
+    counts = defaultdict(int)
+    for path in segments(directory):
+        for event, when, object_id, user_id in read_segment(path):
+            counts[(event, object_id)] += 1
+    return counts
+
+
+_click_log = None
+_click_log_lock = threading.Lock()
+
+
+def get_click_log():
+    # The process-wide log, or None when RANGO_CLICK_LOG_DIR is not set.
+    global _click_log
+    directory = getattr(settings, 'RANGO_CLICK_LOG_DIR', None)
+    if not directory:
+        return None
+
+    with _click_log_lock:
+        if _click_log is None or _click_log.directory != directory:
+            if _click_log is not None:
+                _click_log.close()
+            _click_log = ClickLog(directory,
+                                  getattr(settings, 'RANGO_CLICK_LOG_SEGMENT_SIZE', 64 * 1024 * 1024),
+                                  getattr(settings, 'RANGO_CLICK_LOG_FSYNC_INTERVAL', 1.0))
+        return _click_log
+
+
+def log_event(event, object_id, user=None):
+    click_log = get_click_log()
+    if click_log is not None:
+        user_id = user.id if user is not None and user.is_authenticated() else 0
+        click_log.append(event, object_id, user_id)
+
+
+def close_click_log():
+    if _click_log is not None:
+        _click_log.close()
+
+
+# Make sure everything appended is on disk when the process exits.
+atexit.register(close_click_log)
@@ -0,0 +1,53 @@
+import calendar
+import hashlib
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from rango.versioning import category_version
+
+# Category pages are validated with Category.last_modified, which moves when
+# the category is saved, a page is added or removed, or clicks and likes are
+# written out, and with what the page shows that moves before that: likes and
+# clicks not written out yet, the trending order of the pages, the number of
+# unique visitors and the categories in the sidebar. The view count is left
+# out: it changes on every visit, so a browser showing its own copy shows the
+# count as of when it fetched it.
+
+
+def category_validators(category, user, pages, unique_visitors):
+    """
+    Returns (etag, last modified timestamp) for the page of a category as
+    seen by `user`, listing `pages` in that order. Logged in users see their
+    own name and the Like button, so the ETag is different for every user.
+    """
+    user_id = user.id if user.is_authenticated() else 0
+    last_modified = calendar.timegm(category.last_modified.utctimetuple())
+    shown = '%d:%d:%s:%s' % (category.likes, unique_visitors, category_version(),
+                             ','.join('%d=%d' % (page.id, page.views) for page in pages))
+    etag = hashlib.md5('%d:%s:%d:%s' % (category.id, category.last_modified.isoformat(), user_id, shown)).hexdigest()
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified=None):
+    # True when the copy the client already has is up to date. An ETag sent
+    # by the client takes precedence over its If-Modified-Since date, which
+    # is ignored for responses without a last modified timestamp.
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return None not in (if_modified_since, last_modified) and last_modified <= if_modified_since
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified)
+    # Caches must not hand one user's copy to another.
+    patch_vary_headers(response, ('Cookie',))
+    return response
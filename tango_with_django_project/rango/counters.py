@@ -0,0 +1,458 @@
+import atexit
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from rango.leaderboards import category_leaderboard, page_leaderboard
+from rango.models import Category, CategoryLike, CategoryViewShard, Page
+from rango.suggest import category_suggestions
+
+logger = logging.getLogger(__name__)
+
+# SQLite refuses statements with more than 999 bound parameters,
+# so id lists are written out in chunks below that limit.
+BATCH_SIZE = 500
+
+# Every buffer and sharded counter registers itself here so they can all be
+# written out together (at shutdown, or from the flush_counters command).
+_counters = []
+
+_flusher_lock = threading.Lock()
+_flusher = None
+# Set by FLUSH_SIGNAL, which the flush_counters command sends to every process
+# with buffered counts, to have the flusher write them out within a second.
+# (SIGUSR1 is taken: gunicorn reopens its logs on it.)
+_flush_requested = threading.Event()
+
+FLUSH_SIGNAL = getattr(signal, 'SIGUSR2', None)
+
+
+def flush_all():
+    # Flush every registered counter and report how many rows each one wrote.
+    return dict((counter.name, len(counter.flush())) for counter in _counters)
+
+
+class Counter(object):
+    """
+    Base class for counters whose increments are written out in batches,
+    at most RANGO_COUNTER_FLUSH_INTERVAL seconds apart.
+    """
+    name = None
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._last_flush = time.time()
+        _counters.append(self)
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5)
+
+    def maybe_flush(self):
+        # Called as counts come in, by the request that counted them, so a
+        # failed write is logged rather than failing the request. The counts
+        # are kept for the next flush to retry.
+        if time.time() - self._last_flush >= self.interval:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Error when writing out %s', self.name)
+
+    def flush(self):
+        raise NotImplementedError
+
+
+class WriteBehindBuffer(Counter):
+    """
+    Collects counter increments in memory and writes them to the database
+    in batches. Subclasses implement write(), which receives a dict of
+    key -> amount.
+
+    The increments are only in the memory of the process that counted them.
+    They are written out by that process: on the next increment once the
+    flush interval has passed, by a background thread when no increment
+    comes or when the flush_counters command asks for them, and at exit.
+    """
+
+    def __init__(self, interval=None):
+        super(WriteBehindBuffer, self).__init__(interval)
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._pending[key] += amount
+        self.maybe_flush()
+        start_flusher()
+
+    def pending(self, key):
+        with self._lock:
+            return self._pending.get(key, 0)
+
+    def drain(self):
+        # Swap the pending counts out under the lock so increments arriving
+        # while we write go into a fresh dict.
+        with self._lock:
+            batch = self._pending
+            self._pending = defaultdict(int)
+            self._last_flush = time.time()
+        return batch
+
+    def flush(self):
+        batch = self.drain()
+        if batch:
+            try:
+                self.write(batch)
+            except Exception:
+                # Put the counts back so the next flush retries them.
+                with self._lock:
+                    for key, amount in batch.items():
+                        self._pending[key] += amount
+                raise
+        return batch
+
+    def write(self, batch):
+        raise NotImplementedError
+
+
+def _flush_periodically():
+    # Writes out the buffers of this process, and folds the sharded views and
+    # likes, once their flush interval has passed, so counts are not left
+    # waiting for the next increment when the site goes quiet. Wakes at least
+    # every second to follow the interval, and to see if it was asked to flush.
+    global _flusher
+    while True:
+        interval = getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5)
+        if interval > 0:
+            time.sleep(min(interval, 1))
+            interval = getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5)
+        if interval <= 0:
+            # Every increment is written straight away, so there is nothing to do.
+            with _flusher_lock:
+                _flusher = None
+            _unregister_process()
+            return
+
+        if _flush_requested.is_set():
+            _flush_requested.clear()
+            try:
+                flush_buffers()
+            except Exception:
+                # Not answering tells flush_counters the counts are still here.
+                logger.exception('Error when writing out the buffers for flush_counters')
+            else:
+                _register_process()
+        else:
+            for counter in _counters:
+                counter.maybe_flush()
+        # This thread is not a request, so nothing else closes its connection.
+        connection.close()
+
+
+def start_flusher():
+    # Started by the first increment counted in each process.
+    global _flusher
+    if _flusher is not None or getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5) <= 0:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _register_process()
+            _flusher = threading.Thread(target=_flush_periodically, name='rango-counter-flusher')
+            _flusher.daemon = True
+            _flusher.start()
+
+
+def _pid_file(pid):
+    directory = getattr(settings, 'RANGO_COUNTER_PID_DIR', None)
+    return os.path.join(directory, str(pid)) if directory else None
+
+
+def _register_process():
+    # Each process with buffered counts keeps a file named after its pid, for
+    # flush_counters to find it. The file holds the time of the last flush
+    # asked for by the command, so the command can tell when it is done.
+    path = _pid_file(os.getpid())
+    if path is None or FLUSH_SIGNAL is None:
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(repr(time.time()))
+    except (IOError, OSError):
+        logger.exception('Error when registering for flush_counters')
+
+
+def _unregister_process():
+    path = _pid_file(os.getpid())
+    if path is not None and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _request_flush(signum, frame):
+    # Runs in the main thread, which may be holding a buffer's lock, so it
+    # leaves the writing to the flusher.
+    _flush_requested.set()
+
+
+def install_flush_handler():
+    # Called when Django sets up the apps, which it does in the main thread of
+    # every server process; only that thread may set signal handlers.
+    if FLUSH_SIGNAL is not None:
+        try:
+            signal.signal(FLUSH_SIGNAL, _request_flush)
+        except ValueError:
+            return
+        # Without this, the signal would fail whatever system call the main
+        # thread is in with EINTR.
+        signal.siginterrupt(FLUSH_SIGNAL, False)
+
+
+def flush_servers(timeout):
+    """
+    Asks every other process with buffered counts to write them out, and
+    waits up to `timeout` seconds for them. Returns the pids of the processes
+    that did, and of those that did not answer in time.
+    """
+    directory = getattr(settings, 'RANGO_COUNTER_PID_DIR', None)
+    if FLUSH_SIGNAL is None or not directory or not os.path.isdir(directory):
+        return [], []
+
+    asked = time.time()
+    waiting = set()
+    for name in os.listdir(directory):
+        if not name.isdigit():
+            continue
+        try:
+            os.kill(int(name), FLUSH_SIGNAL)
+            waiting.add(int(name))
+        except OSError:
+            # The process is gone, without its atexit cleanup.
+            os.remove(os.path.join(directory, name))
+
+    asked_pids = sorted(waiting)
+    deadline = time.time() + timeout
+    while waiting and time.time() < deadline:
+        time.sleep(0.1)
+        for pid in list(waiting):
+            try:
+                with open(_pid_file(pid)) as f:
+                    if float(f.read() or 0) >= asked:
+                        waiting.discard(pid)
+            except (IOError, ValueError):
+                # Gone, after writing its buffers out at exit.
+                waiting.discard(pid)
+
+    return [pid for pid in asked_pids if pid not in waiting], sorted(waiting)
+
+
+def group_by_amount(batch):
+    # Most keys in a batch share the same small increment, so grouping them
+    # lets one UPDATE ... WHERE id IN (...) cover many rows.
+    groups = defaultdict(list)
+    for key, amount in batch.items():
+        groups[amount].append(key)
+
+    for amount, keys in groups.items():
+        for i in xrange(0, len(keys), BATCH_SIZE):
+            yield amount, keys[i:i + BATCH_SIZE]
+
+
+class PageViewBuffer(WriteBehindBuffer):
+    # Buffers outbound clicks from track_url, keyed by page id.
+    name = 'page_views'
+
+    def write(self, batch):
+        with transaction.atomic():
+            for amount, ids in group_by_amount(batch):
+                Page.objects.filter(id__in=ids).update(views=F('views') + amount)
+                page_leaderboard.refresh(ids)
+                # The category pages show the view counts of their pages.
+                Category.objects.filter(page__id__in=ids).update(last_modified=timezone.now())
+
+
+click_buffer = PageViewBuffer()
+
+
+def record_page_click(page_id):
+    click_buffer.add(page_id)
+
+
+def with_pending_views(pages):
+    # Add the clicks that have not been written out yet to a list of pages,
+    # keeping the list in most viewed order.
+    pages = list(pages)
+    changed = False
+    for page in pages:
+        pending = click_buffer.pending(page.id)
+        if pending:
+            page.views += pending
+            changed = True
+
+    if changed:
+        pages.sort(key=lambda page: page.views, reverse=True)
+    return pages
+
+
+class CategoryViewCounter(Counter):
+    """
+    Counts category views in RANGO_CATEGORY_VIEW_SHARDS rows per category.
+    Each view bumps one shard picked at random, and flush() folds the shards
+    back into Category.views, at most RANGO_COUNTER_FLUSH_INTERVAL seconds
+    apart as views come in, or from the background flusher when they stop.
+    """
+    name = 'category_views'
+
+    @property
+    def shards(self):
+        return getattr(settings, 'RANGO_CATEGORY_VIEW_SHARDS', 8)
+
+    def add(self, category_id, amount=1):
+        shard = random.randrange(self.shards)
+        shards = CategoryViewShard.objects.filter(category_id=category_id, shard=shard)
+        if not shards.update(count=F('count') + amount):
+            # First view to land on this shard, so create it. Another request may
+            # have beaten us to it, in which case bump the row it created.
+            try:
+                with transaction.atomic():
+                    CategoryViewShard.objects.create(category_id=category_id, shard=shard, count=amount)
+            except IntegrityError:
+                shards.update(count=F('count') + amount)
+
+        self.maybe_flush()
+        start_flusher()
+
+    def pending(self, category_id):
+        total = CategoryViewShard.objects.filter(category_id=category_id).aggregate(total=Sum('count'))['total']
+        return total or 0
+
+    def flush(self):
+        with transaction.atomic():
+            shards = CategoryViewShard.objects.filter(count__gt=0).values_list('id', 'category_id', 'count')
+
+            folded = defaultdict(int)
+            taken = {}
+            for shard_id, category_id, count in shards:
+                folded[category_id] += count
+                taken[shard_id] = count
+
+            # Subtract what was read rather than zeroing the shards, so views
+            # counted while we fold are kept for the next rollup.
+            for amount, ids in group_by_amount(taken):
+                CategoryViewShard.objects.filter(id__in=ids).update(count=F('count') - amount)
+            for amount, ids in group_by_amount(folded):
+                Category.objects.filter(id__in=ids).update(views=F('views') + amount)
+
+        self._last_flush = time.time()
+        return folded
+
+
+category_view_counter = CategoryViewCounter()
+
+
+def record_category_view(category):
+    category_view_counter.add(category.id)
+
+
+def category_views(category):
+    # Live total: the views already folded into the category plus the shards.
+    # Any view may fold the shards, so both are read in one transaction, which
+    # cannot count the same views twice or miss them.
+    with transaction.atomic():
+        views = Category.objects.filter(id=category.id).values_list('views', flat=True)[0]
+        return views + category_view_counter.pending(category.id)
+
+
+def flush_buffers():
+    # Only the in-memory buffers lose data when the process goes away;
+    # sharded counters are already in the database.
+    for counter in _counters:
+        if isinstance(counter, WriteBehindBuffer):
+            counter.flush()
+
+
+class CategoryLikeCounter(Counter):
+    """
+    Folds the CategoryLike ledger into Category.likes. Likes that have not
+    been counted yet are added to Category.likes in one batch per flush,
+    instead of rewriting the category row on every click.
+    """
+    name = 'category_likes'
+
+    def add(self, user, category_id):
+        # The ledger holds one like per user and category, so liking twice
+        # is a no-op. Returns whether the like was new.
+        try:
+            with transaction.atomic():
+                CategoryLike.objects.create(user=user, category_id=category_id)
+        except IntegrityError:
+            return False
+
+        self.maybe_flush()
+        start_flusher()
+        return True
+
+    def pending(self, category_id):
+        return CategoryLike.objects.filter(category_id=category_id, counted=False).count()
+
+    def flush(self):
+        with transaction.atomic():
+            likes = CategoryLike.objects.filter(counted=False).values_list('id', 'category_id')
+
+            by_category = defaultdict(list)
+            for like_id, category_id in likes:
+                by_category[category_id].append(like_id)
+
+            # Claim the likes before counting them. Another flush may have
+            # claimed some of them since we read them, so only the likes this
+            # one marked as counted are added.
+            folded = defaultdict(int)
+            for category_id, ids in by_category.items():
+                for i in xrange(0, len(ids), BATCH_SIZE):
+                    claimed = CategoryLike.objects.filter(id__in=ids[i:i + BATCH_SIZE], counted=False)
+                    folded[category_id] += claimed.update(counted=True)
+            folded = dict((category_id, amount) for category_id, amount in folded.items() if amount)
+
+            for amount, category_ids in group_by_amount(folded):
+                Category.objects.filter(id__in=category_ids).update(likes=F('likes') + amount,
+                                                                    last_modified=timezone.now())
+                category_leaderboard.refresh(category_ids)
+                category_suggestions.refresh(category_ids)
+
+        self._last_flush = time.time()
+        return folded
+
+
+category_like_counter = CategoryLikeCounter()
+
+
+def record_category_like(user, category):
+    return category_like_counter.add(user, category.id)
+
+
+def category_likes(category):
+    # Read the folded likes and the ledger in one transaction, so a flush
+    # running in between cannot count the same likes twice or miss them.
+    with transaction.atomic():
+        likes = Category.objects.filter(id=category.id).values_list('likes', flat=True)[0]
+        return likes + category_like_counter.pending(category.id)
+
+
+# Whatever is still buffered when the process exits gets written out, after
+# which flush_counters has nothing to ask of it (atexit runs these last first).
+atexit.register(_unregister_process)
+atexit.register(flush_buffers)
@@ -0,0 +1,127 @@
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+
+from rango.search import get_backend, run_query
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # The process-wide threads the searches run on.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, 'RANGO_SEARCH_FANOUT_THREADS', 8))
+        return _pool
+
+
+def url_key(link):
+    # Links differing only in scheme, case of the host or a trailing slash
+    # are the same result.
+    parts = urlsplit(link)
+    return parts.netloc.lower(), parts.path.rstrip('/') or '/', parts.query
+
+
+def merge(results_by_source):
+    """
+    Merges lists of results, taking one from each list in turn, so the top
+    results of every source come first. Results with the same link as one
+    already taken are dropped.
+    """
+    merged = []
+    seen = set()
+    for i in xrange(max([len(results) for results in results_by_source] or [0])):
+        for results in results_by_source:
+            if i < len(results):
+                key = url_key(results[i]['link'])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(results[i])
+    return merged
+
+
+def _search(query, offset, results_per_source, source, expires):
+    # Runs on the pool. A search still waiting for a thread when nobody is
+    # waiting for its results any more is dropped, so that searches queued
+    # behind a slow source do not hold up the threads further.
+    if expires is not None and time.time() > expires:
+        return []
+    try:
+        return run_query(query, offset, results_per_source, backend=source)
+    finally:
+        # The pool's threads are not requests, so nothing else closes the
+        # database connection a search may have opened on them.
+        connection.close()
+
+
+class FanOutResults(list):
+    # The merged results, and whether any source may have another page.
+    has_next = False
+
+
+def prefetch(query, sources, offset, results_per_source, deadline=None):
+    """
+    Starts searching `sources` from `offset` in the background, without
+    waiting for the results, so they are in the result cache by the time
+    they are asked for. Returns the pending results by source. Sources that
+    are searched in the request (see SearchBackend.threaded) are left out,
+    and so are searches that do not get a thread within `deadline` seconds.
+    """
+    pool = get_pool()
+    expires = time.time() + deadline if deadline is not None else None
+    return dict((source, pool.apply_async(_search, (query, offset, results_per_source, source, expires)))
+                for source in sources if get_backend(source).threaded)
+
+
+def fan_out(query, sources=None, results_per_source=10, deadline=None, page=1):
+    """
+    Searches all the `sources`, by default RANGO_SEARCH_FANOUT_SOURCES, at
+    the same time for the given page of results and merges them. Whatever
+    has not finished after `deadline` seconds, by default
+    RANGO_SEARCH_FANOUT_DEADLINE, is left out. It carries on in the
+    background, and its results are cached for the next time. The next page
+    of the sources that filled this one is then searched in the background,
+    unless RANGO_SEARCH_PREFETCH is False. Sources that are not threaded
+    are searched in the request, while the others run.
+    """
+    sources = sources or getattr(settings, 'RANGO_SEARCH_FANOUT_SOURCES', ('bing',))
+    if deadline is None:
+        deadline = getattr(settings, 'RANGO_SEARCH_FANOUT_DEADLINE', 2.0)
+    give_up = time.time() + deadline
+    offset = (page - 1) * results_per_source
+
+    pending = prefetch(query, sources, offset, results_per_source, deadline)
+
+    results_by_source = []
+    full_sources = []
+    for source in sources:
+        try:
+            if source in pending:
+                results = pending[source].get(max(give_up - time.time(), 0))
+            else:
+                results = run_query(query, offset, results_per_source, backend=source)
+        except TimeoutError:
+            print "Search with %s did not finish in time" % source
+            continue
+        except Exception, e:
+            print "Error when searching with %s: %s" % (source, e)
+            continue
+
+        # Label each result with where it came from. The lists are cached,
+        # so they are copied rather than changed.
+        results_by_source.append([dict(result, source=source) for result in results])
+        if len(results) >= results_per_source:
+            full_sources.append(source)
+
+    merged = FanOutResults(merge(results_by_source))
+    merged.has_next = bool(full_sources)
+    if full_sources and getattr(settings, 'RANGO_SEARCH_PREFETCH', True):
+        prefetch(query, full_sources, offset + results_per_source, results_per_source, deadline)
+    return merged
@@ -0,0 +1,64 @@
+import hashlib
+import math
+import struct
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values added to it, using a fixed
+    2 ** precision bytes of registers (1KB by default, about 3% error).
+    Two sketches are merged by taking the maximum of each register, so
+    sketches from different days or processes can be combined freely.
+    """
+
+    def __init__(self, registers=None, precision=10):
+        if registers is not None:
+            self.registers = bytearray(registers)
+            precision = int(math.log(len(self.registers), 2))
+        else:
+            self.registers = bytearray(1 << precision)
+        self.precision = precision
+
+    def add(self, value):
+        # Returns True if the value changed a register, i.e. the sketch has
+        # to be written back. Once warmed up, most values change nothing.
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        hashed = struct.unpack('>Q', hashlib.sha1(value).digest()[:8])[0]
+
+        # The first `precision` bits pick the register; the register keeps
+        # the longest run of leading zeros seen in the remaining bits, plus one.
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        # Returns True if any register changed.
+        if len(other.registers) != len(self.registers):
+            raise ValueError('Cannot merge sketches of different precision')
+
+        changed = False
+        for index, rank in enumerate(other.registers):
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+                changed = True
+        return changed
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+
+        # Small cardinalities are estimated better by counting empty registers.
+        empty = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(float(m) / empty)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
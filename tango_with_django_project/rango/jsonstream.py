@@ -0,0 +1,187 @@
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_delimiters = _whitespace + ',:]}'
+
+# What to look for next when scanning past a value: its end if it is a
+# number, true, false or null, the end or escape of a string, and the
+# strings and brackets of an object or array.
+_scalar_end = re.compile('[%s]' % re.escape(_delimiters))
+_string_special = re.compile(r'["\\]')
+_structural = re.compile(r'["{}\[\]]')
+
+
+class _Reader(object):
+    # Reads a JSON document from a file-like object a chunk at a time,
+    # keeping only the part not yet parsed.
+
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        # Reads another chunk; False at the end of the stream.
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        # The next character that is not whitespace, or '' at the end.
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _whitespace:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of %r, found %r' % (characters, character))
+        self._pos += 1
+        return character
+
+    def _scan(self, keep):
+        # Finds where the next value ends by following its strings and
+        # nesting, without decoding it, and returns that position. With
+        # `keep` the value stays in the buffer from self._pos; otherwise what
+        # has been scanned is let go as more of the stream is read.
+        first = self.peek()
+        if not first:
+            raise ValueError('Expected a value, found the end of the document')
+        i = self._pos
+        depth = 0
+        in_string = False
+        scalar = first not in '"{['
+        while True:
+            buffer = self._buffer
+            if scalar:
+                match = _scalar_end.search(buffer, i)
+                if match:
+                    return match.start()
+                i = len(buffer)
+            elif in_string:
+                match = _string_special.search(buffer, i)
+                if match and match.group() == '"':
+                    in_string = False
+                    i = match.end()
+                    if depth == 0:
+                        return i
+                    continue
+                if match and match.end() < len(buffer):
+                    # Step over the escaped character.
+                    i = match.end() + 1
+                    continue
+                i = match.start() if match else len(buffer)
+            else:
+                match = _structural.search(buffer, i)
+                if match:
+                    i = match.end()
+                    character = match.group()
+                    if character == '"':
+                        in_string = True
+                    elif character in '{[':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return i
+                    continue
+                i = len(buffer)
+
+            if not keep:
+                self._pos = i
+            start = self._pos
+            if not self._fill():
+                if scalar:
+                    return i
+                raise ValueError('Unexpected end of the document')
+            i -= start
+
+    def skip(self):
+        # Steps over the next value without decoding it.
+        self._pos = self._scan(False)
+
+    def value(self):
+        # Decodes the next value. A number is only complete once what follows
+        # it is read, as one cut off by the end of a chunk still decodes.
+        first = self.peek()
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+            if self._eof or (end < len(self._buffer) and (first in '"{[' or self._buffer[end] in _delimiters)):
+                self._pos = end
+                return value
+        except ValueError:
+            if self._eof:
+                raise
+
+        # The value goes on past what has been read. Its end is found first,
+        # so it is decoded once more rather than again on every chunk.
+        end = self._scan(True)
+        value, decoded_end = _decoder.raw_decode(self._buffer, self._pos)
+        if decoded_end != end:
+            raise ValueError('Invalid JSON at %r' % self._buffer[decoded_end:end][:20])
+        self._pos = end
+        return value
+
+
+def iter_items(stream, path, fields=None, chunk_size=8192):
+    """
+    Yields the items of the array found by following the keys in `path`
+    from the top of the JSON document read from `stream`, such as
+    ('d', 'results') for {"d": {"results": [...]}}. Only one item is held in
+    memory at a time, and the stream is read no further than the items
+    taken. The values of keys not on the path are skipped without being
+    decoded. With `fields`, items that are objects are reduced to a dict of
+    just those keys; other items are yielded as they are. Yields nothing
+    when the path is not in the document, and raises ValueError when the
+    document is not valid JSON.
+    """
+    reader = _Reader(stream, chunk_size)
+
+    # Find each key of the path in turn, skipping the values of all others.
+    for key in path:
+        for name in _keys(reader):
+            if name == key:
+                break
+            reader.skip()
+        else:
+            return
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        item = reader.value()
+        if fields is not None and isinstance(item, dict):
+            item = dict((field, item[field]) for field in fields if field in item)
+        yield item
+        if reader.expect(',]') == ']':
+            return
+
+
+def _keys(reader):
+    # Yields the keys of the object starting at the next character. Each
+    # value has to be read or skipped before asking for the next key.
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        yield name
+        if reader.expect(',}') == '}':
+            return
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from rango.models import Category, Page
+
+
+class Leaderboard(object):
+    """
+    The top `size` rows of a model by one field, kept in the cache so the
+    index can show them without querying the database.
+
+    The cache holds the top `depth` rows, plus the score of the lowest of
+    them when it was built (the floor). Every row outside the board scores
+    at or below the floor, so a row whose score rises above it can be moved
+    in, and a row falling below it can be dropped, without looking at the
+    other rows. When deletions or decreases leave fewer than `size` rows
+    above the floor, the board is rebuilt from the database on next read,
+    as it is after a cold start.
+    """
+
+    def __init__(self, name, model, field, fields, size=5, depth=20):
+        self.key = 'rango:leaderboard:%s' % name
+        self.model = model
+        self.field = field
+        self.fields = ('id', field) + tuple(fields)
+        self.size = size
+        self.depth = depth
+
+    def _timeout(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_TIMEOUT', 5 * 60)
+
+    def _build(self):
+        rows = list(self.model.objects.order_by('-' + self.field).values(*self.fields)[:self.depth])
+        # No floor means every row of the table is on the board.
+        floor = rows[-1][self.field] if len(rows) == self.depth else None
+        board = {'rows': dict((row['id'], row) for row in rows), 'floor': floor}
+        cache.set(self.key, board, self._timeout())
+        return board
+
+    def _usable(self, board):
+        return board is not None and (board['floor'] is None or len(board['rows']) >= self.size)
+
+    def top(self):
+        board = cache.get(self.key)
+        if not self._usable(board):
+            board = self._build()
+
+        rows = sorted(board['rows'].values(), key=lambda row: (-row[self.field], row['id']))
+        return [self.model(**row) for row in rows[:self.size]]
+
+    def update(self, rows):
+        # Record the new scores of rows, given as dicts of self.fields.
+        board = cache.get(self.key)
+        if board is None:
+            # Nothing to update; the board is built on the next read.
+            return
+
+        for row in rows:
+            self._update(board, row)
+        cache.set(self.key, board, self._timeout())
+
+    def _update(self, board, row):
+        rows, floor = board['rows'], board['floor']
+        score = row[self.field]
+        if floor is None or score > floor or (row['id'] in rows and score == floor):
+            rows[row['id']] = row
+            if len(rows) > self.depth:
+                lowest = min(rows.values(), key=lambda row: row[self.field])
+                del rows[lowest['id']]
+                board['floor'] = lowest[self.field]
+        else:
+            # It fell below the floor, where rows outside the board may beat it.
+            rows.pop(row['id'], None)
+
+    def update_instance(self, instance):
+        self.update([dict((name, getattr(instance, name)) for name in self.fields)])
+
+    def refresh(self, ids):
+        # Re-read the scores of rows changed with an UPDATE query.
+        # Callers pass ids in chunks small enough for one IN (...) query.
+        if cache.get(self.key) is not None:
+            self.update(self.model.objects.filter(id__in=list(ids)).values(*self.fields))
+
+    def remove(self, id):
+        board = cache.get(self.key)
+        if board is not None and board['rows'].pop(id, None) is not None:
+            cache.set(self.key, board, self._timeout())
+
+    def clear(self):
+        cache.delete(self.key)
+
+
+category_leaderboard = Leaderboard('categories', Category, 'likes', ('name', 'slug'))
+page_leaderboard = Leaderboard('pages', Page, 'views', ('title', 'url', 'category_id'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from rango.activity import compact
+
+
+class Command(BaseCommand):
+    help = 'Compacts old hourly activity buckets into daily and monthly buckets.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('%d buckets compacted' % compact())
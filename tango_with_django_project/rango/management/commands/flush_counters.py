@@ -0,0 +1,31 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from rango.counters import flush_all, flush_servers
+# Imported for their buffers, which register themselves with the counters.
+import rango.activity
+import rango.trending
+
+
+class Command(BaseCommand):
+    # Buffered clicks are in the memory of the server process that counted
+    # them. Every such process leaves its pid in RANGO_COUNTER_PID_DIR, and is
+    # sent a signal to write them out (see rango.counters.flush_servers).
+    help = ('Has running servers write out the clicks they buffered, then folds '
+            'category view shards and uncounted likes into their categories.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--timeout', dest='timeout', type='float', default=10,
+                    help='Seconds to wait for the servers to write out their buffers.'),
+    )
+
+    def handle(self, *args, **options):
+        flushed, timed_out = flush_servers(options['timeout'])
+        for pid in flushed:
+            self.stdout.write('Process %d wrote out its buffers' % pid)
+        for pid in timed_out:
+            self.stderr.write('Process %d did not write out its buffers within %g seconds' % (pid, options['timeout']))
+
+        for name, written in sorted(flush_all().items()):
+            self.stdout.write('%s: %d rows updated' % (name, written))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from rango import textindex
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text index of categories and pages from the database.'
+
+    def handle(self, *args, **options):
+        if not textindex.enabled():
+            raise CommandError('The full-text index needs SQLite with FTS5.')
+        with transaction.atomic():
+            cursor = connection.cursor()
+            textindex.create(cursor)
+            textindex.rebuild(cursor)
+        self.stdout.write('Full-text index rebuilt')
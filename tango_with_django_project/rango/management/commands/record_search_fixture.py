@@ -0,0 +1,47 @@
+import json
+import os
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rango.search import get_backend
+from rango.searchcache import normalize_query
+from rango.searchclient import SearchError
+
+
+class Command(BaseCommand):
+    args = '<query query ...>'
+    help = ('Runs the given searches and records their results in the RANGO_SEARCH_FIXTURE file, '
+            'for the fixture search backend to replay.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--backend', dest='backend', default='bing',
+                    help='The search backend to record from (default: bing).'),
+        make_option('--count', dest='count', type='int', default=50,
+                    help='How many results to record per search (default: 50).'),
+    )
+
+    def handle(self, *queries, **options):
+        path = getattr(settings, 'RANGO_SEARCH_FIXTURE', None)
+        if not path:
+            raise CommandError('RANGO_SEARCH_FIXTURE is not set.')
+        if not queries:
+            raise CommandError('Give the searches to record.')
+
+        # Add to what was recorded before.
+        fixture = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                fixture = json.load(f)
+
+        backend = get_backend(options['backend'])
+        for query in queries:
+            try:
+                fixture[normalize_query(query)] = backend.search(query, 0, options['count'])
+            except SearchError, e:
+                raise CommandError('Searching for %r failed: %s' % (query, e))
+
+        with open(path, 'w') as f:
+            json.dump(fixture, f, indent=1, sort_keys=True)
+        self.stdout.write('Recorded %d searches in %s' % (len(queries), path))
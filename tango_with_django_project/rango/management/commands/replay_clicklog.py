@@ -0,0 +1,85 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from rango import clicklog
+from rango.counters import group_by_amount
+from rango.leaderboards import category_leaderboard, page_leaderboard
+from rango.models import Category, CategoryLike, CategoryViewShard, Page
+from rango.suggest import category_suggestions
+
+
+class Command(BaseCommand):
+    help = ('Replays the click log and compares the logged page clicks, category views and '
+            'category likes with Page.views, Category.views and Category.likes. With --apply '
+            '--from-zero, the counts are rebuilt from the log.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--apply', action='store_true', dest='apply', default=False,
+                    help='Replace Page.views, Category.views and Category.likes with the counts in the log.'),
+        make_option('--from-zero', action='store_true', dest='from_zero', default=False,
+                    help='Confirm that the log holds every click, view and like since counting started. '
+                         'Anything counted before the log was switched on is lost by --apply.'),
+    )
+
+    def handle(self, *args, **options):
+        directory = getattr(settings, 'RANGO_CLICK_LOG_DIR', None)
+        if not directory:
+            raise CommandError('RANGO_CLICK_LOG_DIR is not set.')
+
+        counts = clicklog.replay(directory)
+        page_views = dict((id, n) for (event, id), n in counts.items() if event == clicklog.PAGE_CLICK)
+        category_views = dict((id, n) for (event, id), n in counts.items() if event == clicklog.CATEGORY_VIEW)
+        category_likes = dict((id, n) for (event, id), n in counts.items() if event == clicklog.CATEGORY_LIKE)
+
+        if options['apply']:
+            if not options['from_zero']:
+                raise CommandError('--apply replaces the counts with those in the log, so views and likes '
+                                   'counted before the log was switched on are lost. Add --from-zero '
+                                   'if the log goes back to when counting started.')
+
+            # Only run this while nothing else is writing counters: clicks still
+            # buffered by a running server are in the log already.
+            with transaction.atomic():
+                # The category pages show the page views, so they change too.
+                Category.objects.update(last_modified=timezone.now())
+                Page.objects.update(views=0)
+                for amount, ids in group_by_amount(page_views):
+                    Page.objects.filter(id__in=ids).update(views=amount)
+
+                CategoryViewShard.objects.all().delete()
+                Category.objects.update(views=0)
+                for amount, ids in group_by_amount(category_views):
+                    Category.objects.filter(id__in=ids).update(views=amount)
+
+                # Every like in the ledger is in the log, so none is left to count.
+                CategoryLike.objects.filter(counted=False).update(counted=True)
+                Category.objects.update(likes=0)
+                for amount, ids in group_by_amount(category_likes):
+                    Category.objects.filter(id__in=ids).update(likes=amount)
+
+            page_leaderboard.clear()
+            category_leaderboard.clear()
+            category_suggestions.clear()
+            self.stdout.write('Rebuilt views of %d pages and %d categories, and likes of %d categories'
+                              % (len(page_views), len(category_views), len(category_likes)))
+            return
+
+        # Category views not folded in yet are still on the shards, and likes
+        # not counted yet are in the ledger.
+        sharded = dict(CategoryViewShard.objects.values('category').annotate(
+            total=Sum('count')).values_list('category', 'total'))
+        uncounted = dict(CategoryLike.objects.filter(counted=False).values('category').annotate(
+            total=Count('id')).values_list('category', 'total'))
+
+        for model, field, logged, pending in ((Page, 'views', page_views, {}),
+                                              (Category, 'views', category_views, sharded),
+                                              (Category, 'likes', category_likes, uncounted)):
+            for id, count in model.objects.values_list('id', field).order_by('id'):
+                count += pending.get(id, 0)
+                if logged.get(id, 0) != count:
+                    self.stdout.write('%s %d: %d %s, %d in log' % (model.__name__, id, count, field, logged.get(id, 0)))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rango', '0002_categoryviewshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryLike',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('counted', models.BooleanField(default=False)),
+                ('category', models.ForeignKey(to='rango.Category')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorylike',
+            unique_together=set([('user', 'category')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='categorylike',
+            index_together=set([('category', 'counted')]),
+        ),
+    ]
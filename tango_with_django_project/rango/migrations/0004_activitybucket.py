@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0003_categorylike'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBucket',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=16, choices=[(b'page_clicks', b'Page clicks'), (b'category_views', b'Category views')])),
+                ('object_id', models.IntegerField()),
+                ('granularity', models.CharField(max_length=1, choices=[(b'h', b'Hour'), (b'd', b'Day'), (b'm', b'Month')])),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activitybucket',
+            unique_together=set([('kind', 'granularity', 'start', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='activitybucket',
+            index_together=set([('kind', 'start')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0004_activitybucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=16, choices=[(b'category', b'Category'), (b'page', b'Page')])),
+                ('object_id', models.IntegerField()),
+                ('era', models.IntegerField()),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trendingscore',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='trendingscore',
+            index_together=set([('kind', 'era', 'score')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0005_trendingscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueVisitorSketch',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=16, choices=[(b'category', b'Category'), (b'page', b'Page')])),
+                ('object_id', models.IntegerField()),
+                ('day', models.DateField()),
+                ('registers', models.BinaryField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uniquevisitorsketch',
+            unique_together=set([('kind', 'object_id', 'day')]),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The SQL is written out here rather than taken from rango.textindex, so
+# that this migration does the same whatever becomes of that module.
+CREATE_SQL = ("CREATE VIRTUAL TABLE IF NOT EXISTS rango_textindex USING fts5("
+              "title, url, category, tokenize = 'unicode61 remove_diacritics 1', prefix = '2 3')")
+
+FILL_SQL = [
+    "INSERT INTO rango_textindex (rowid, title, url, category) "
+    "SELECT id * 2, name, '', '' FROM rango_category",
+    "INSERT INTO rango_textindex (rowid, title, url, category) "
+    "SELECT p.id * 2 + 1, p.title, p.url, c.name "
+    "FROM rango_page p JOIN rango_category c ON c.id = p.category_id",
+]
+
+
+def has_fts5(cursor):
+    cursor.execute('PRAGMA compile_options')
+    return 'ENABLE_FTS5' in [row[0] for row in cursor.fetchall()]
+
+
+def create_textindex(apps, schema_editor):
+    # The full-text index is an SQLite FTS5 table. Other databases, and
+    # SQLite builds without FTS5, go without; the rebuild_textindex command
+    # creates it if FTS5 becomes available later.
+    if schema_editor.connection.vendor == 'sqlite':
+        cursor = schema_editor.connection.cursor()
+        if has_fts5(cursor):
+            cursor.execute(CREATE_SQL)
+            for sql in FILL_SQL:
+                cursor.execute(sql)
+
+
+def drop_textindex(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.connection.cursor().execute('DROP TABLE IF EXISTS rango_textindex')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0007_category_last_modified'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_textindex, drop_textindex),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_name_lower(apps, schema_editor):
+    # In Python, as SQLite's lower() only knows ASCII letters.
+    Category = apps.get_model('rango', 'Category')
+    for id, name in Category.objects.values_list('id', 'name'):
+        Category.objects.filter(id=id).update(name_lower=name.lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_textindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='name_lower',
+            field=models.CharField(default='', max_length=128, editable=False, db_index=True),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_name_lower, lambda apps, schema_editor: None),
+        migrations.AlterField(
+            model_name='category',
+            name='likes',
+            field=models.IntegerField(default=0, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='views',
+            field=models.IntegerField(default=0, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='page',
+            index_together=set([('category', 'views')]),
+        ),
+    ]
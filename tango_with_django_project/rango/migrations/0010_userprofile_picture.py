@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import rango.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='picture',
+            field=models.ImageField(default=b'profile_images/default.png', upload_to=rango.models.file_rename, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -3,14 +3,29 @@ from django.template.defaultfilters import slugify
 from django.contrib.auth.models import User
 import os
 
+class CategoryQuerySet(models.QuerySet):
+    def name_starts_with(self, prefix):
+        # Case-insensitive, as a range of the lower-cased names so the index
+        # on them is used; name__istartswith is a LIKE, which cannot use one.
+        prefix = prefix.lower()
+        return self.filter(name_lower__gte=prefix, name_lower__lt=prefix + u'\uffff')
+
 class Category(models.Model):
     name = models.CharField(max_length=128, unique=True)
+    # The name in lower case, for prefix searches (see name_starts_with).
+    name_lower = models.CharField(max_length=128, db_index=True, editable=False)
     views = models.IntegerField(default=0)
-    likes = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0, db_index=True)
     slug = models.SlugField(unique=True)
+    # When the category or anything shown on its page last changed, apart
+    # from the view count (see rango.conditional).
+    last_modified = models.DateTimeField(auto_now=True)
+
+    objects = CategoryQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
+        self.name_lower = self.name.lower()
         super(Category, self).save(*args, **kwargs)
 
     def __unicode__(self):
@@ -20,11 +35,119 @@ class Page(models.Model):
     category = models.ForeignKey(Category)
     title = models.CharField(max_length=128)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    views = models.IntegerField(default=0, db_index=True)
+
+    class Meta:
+        # A category's pages are listed most viewed first.
+        index_together = [('category', 'views')]
 
     def __unicode__(self):
         return self.title
 
+class CategoryViewShard(models.Model):
+    # Category views are counted across several shard rows so concurrent
+    # views of one category do not all contend for the same row.
+    category = models.ForeignKey(Category)
+    shard = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('category', 'shard')
+
+    def __unicode__(self):
+        return u'%s #%d' % (self.category, self.shard)
+
+class CategoryLike(models.Model):
+    # One row per user and category, so a user can only like a category once.
+    # Likes not yet added to Category.likes have counted=False.
+    user = models.ForeignKey(User)
+    category = models.ForeignKey(Category)
+    created = models.DateTimeField(auto_now_add=True)
+    counted = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('user', 'category')
+        index_together = [('category', 'counted')]
+
+    def __unicode__(self):
+        return u'%s likes %s' % (self.user, self.category)
+
+class ActivityBucket(models.Model):
+    # Pre-aggregated page clicks and category views per object and time bucket.
+    # Clicks land in hourly buckets, which are later compacted into daily and
+    # then monthly buckets, so range queries read a handful of rows.
+    PAGE_CLICKS = 'page_clicks'
+    CATEGORY_VIEWS = 'category_views'
+    KIND_CHOICES = (
+        (PAGE_CLICKS, 'Page clicks'),
+        (CATEGORY_VIEWS, 'Category views'),
+    )
+
+    HOUR = 'h'
+    DAY = 'd'
+    MONTH = 'm'
+    GRANULARITY_CHOICES = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+        (MONTH, 'Month'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    granularity = models.CharField(max_length=1, choices=GRANULARITY_CHOICES)
+    start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('kind', 'granularity', 'start', 'object_id')
+        index_together = [('kind', 'start')]
+
+    def __unicode__(self):
+        return u'%s %s %s@%s' % (self.kind, self.object_id, self.granularity, self.start)
+
+class TrendingScore(models.Model):
+    # Time-decayed popularity of a category or page, see rango.trending.
+    # Scores are only comparable within an era, hence the (kind, era, score) index.
+    CATEGORY = 'category'
+    PAGE = 'page'
+    KIND_CHOICES = (
+        (CATEGORY, 'Category'),
+        (PAGE, 'Page'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    era = models.IntegerField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        index_together = [('kind', 'era', 'score')]
+
+    def __unicode__(self):
+        return u'%s %s: %s' % (self.kind, self.object_id, self.score)
+
+class UniqueVisitorSketch(models.Model):
+    # HyperLogLog registers estimating the distinct visitors of a category
+    # or page on one day, see rango.hyperloglog.
+    CATEGORY = 'category'
+    PAGE = 'page'
+    KIND_CHOICES = (
+        (CATEGORY, 'Category'),
+        (PAGE, 'Page'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    day = models.DateField()
+    registers = models.BinaryField()
+
+    class Meta:
+        unique_together = ('kind', 'object_id', 'day')
+
+    def __unicode__(self):
+        return u'%s %s on %s' % (self.kind, self.object_id, self.day)
+
 def file_rename(instance, filename):
         name, extension = os.path.splitext(filename)
         upload_path = 'profile_images'
@@ -0,0 +1,75 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import Context
+from django.template.loader import get_template
+from django.utils.encoding import force_bytes, force_text
+
+from rango.versioning import content_version
+
+# Rendered pages are cached for anonymous visitors only: logged in users see
+# their own name, links and buttons. The few parts of a page that change on
+# every visit, like the visit counter, are rendered from their own templates
+# with the {% fragment %} tag, which marks them in the page so they can be
+# rendered again into a cached copy.
+FRAGMENT = re.compile(r'<!--fragment:(?P<name>[^>]+?)-->.*?<!--/fragment:(?P=name)-->', re.DOTALL)
+
+
+def _timeout():
+    return getattr(settings, 'RANGO_PAGE_CACHE_TIMEOUT', 60)
+
+
+# The query parameters the cached views read, with the values that change the
+# page. Anything else in the query string, like tracking parameters or cache
+# busters, gets the page cached for the path rather than a copy of its own.
+QUERY_PARAMS = {'order': ('trending',)}
+
+
+def _key(request, variant):
+    # Saving or deleting a category or page bumps the content version, which
+    # drops every cached page at once. Views that know more precisely what
+    # their page shows, like an ETag, pass it as the variant.
+    query = ['%s=%s' % (name, request.GET[name]) for name, values in sorted(QUERY_PARAMS.items())
+             if request.GET.get(name) in values]
+    path = hashlib.md5(force_bytes(request.path + '?' + '&'.join(query))).hexdigest()
+    return 'rango:page:%s:%s:%s' % (content_version(), path, variant)
+
+
+def cacheable(request):
+    # A request only costs a session lookup here if it sent a session cookie.
+    return bool(_timeout()) and request.method == 'GET' and not request.user.is_authenticated()
+
+
+def get_cached_page(request, variant=''):
+    if not cacheable(request):
+        return None
+    return cache.get(_key(request, variant))
+
+
+def cache_page(request, response, variant=''):
+    if cacheable(request) and response.status_code == 200:
+        page = {'content': response.content, 'content_type': response['Content-Type']}
+        cache.set(_key(request, variant), page, _timeout())
+
+
+def render_fragment(template_name, context):
+    content = get_template(template_name).render(context)
+    return u'<!--fragment:%s-->%s<!--/fragment:%s-->' % (template_name, content, template_name)
+
+
+def cached_response(page, fragments):
+    """
+    Returns a response with the cached page, in which the fragments named in
+    `fragments`, a dict of template name -> context dict, are rendered again.
+    """
+    def render(match):
+        name = match.group('name')
+        if name not in fragments:
+            return match.group(0)
+        return render_fragment(name, Context(fragments[name]))
+
+    content = FRAGMENT.sub(render, force_text(page['content']))
+    return HttpResponse(content, content_type=page['content_type'])
@@ -0,0 +1,165 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from rango import bing_search, textindex
+from rango.breaker import SearchUnavailable, search_breaker, search_rate_limit
+from rango.searchcache import normalize_query, search_cache
+from rango.searchclient import SearchError
+from rango.singleflight import SingleFlight, SingleFlightError, SingleFlightTimeout
+
+search_flights = SingleFlight('search')
+
+
+class SearchBackend(object):
+    """
+    Something to search. search() returns up to `limit` results, skipping
+    the first `offset`, as dicts of title, link and summary. It raises
+    SearchError when the search could not be run.
+
+    Backends that are `threaded` are searched on the fan out's threads (see
+    rango.fanout). The others are searched in the request, which suits
+    quick searches of our own database.
+    """
+    name = None
+    threaded = True
+
+    def search(self, query, offset, limit):
+        raise NotImplementedError
+
+
+class BingBackend(SearchBackend):
+    # The web, through the Bing API. Needs BING_API_KEY in keys.py.
+    name = 'bing'
+    source = 'Web'
+
+    def search(self, query, offset, limit):
+        # Refused straight away while Bing keeps failing or our quota is spent.
+        return search_breaker.call(self._fetch, query, offset, limit)
+
+    def _fetch(self, query, offset, limit):
+        search_rate_limit.take()
+        return bing_search.fetch_results(query, offset, limit, self.source)
+
+
+class BingNewsBackend(BingBackend):
+    # News articles, through the Bing API.
+    name = 'bing-news'
+    source = 'News'
+
+
+class LocalBackend(SearchBackend):
+    # Our own categories and pages, through the full-text index (see
+    # rango.textindex), best matches first. Needs no network.
+    name = 'local'
+    threaded = False
+
+    def search(self, query, offset, limit):
+        if not textindex.enabled():
+            raise SearchError('The local search index needs SQLite with FTS5.')
+        return textindex.search(query, offset, limit)
+
+
+class FixtureBackend(SearchBackend):
+    """
+    Replays results recorded in the JSON file RANGO_SEARCH_FIXTURE, mapping
+    normalized queries to lists of results (see the record_search_fixture
+    command). Queries not in the file get the results under "*", if any.
+    """
+    name = 'fixture'
+
+    def __init__(self):
+        self._path = None
+        self._fixture = {}
+
+    def _load(self):
+        path = getattr(settings, 'RANGO_SEARCH_FIXTURE', None)
+        if not path:
+            raise SearchError('RANGO_SEARCH_FIXTURE is not set.')
+        if path != self._path:
+            try:
+                with open(path) as f:
+                    self._fixture = json.load(f)
+            except (IOError, ValueError), e:
+                raise SearchError('Could not read %s: %s' % (path, e))
+            self._path = path
+        return self._fixture
+
+    def search(self, query, offset, limit):
+        fixture = self._load()
+        results = fixture.get(normalize_query(query), fixture.get('*', []))
+        return results[offset:offset + limit]
+
+
+_backends = {}
+
+
+def register_backend(backend_class):
+    _backends[backend_class.name] = backend_class()
+    return backend_class
+
+
+for backend_class in (BingBackend, BingNewsBackend, LocalBackend, FixtureBackend):
+    register_backend(backend_class)
+
+
+def get_backend(name=None):
+    # The backend registered under `name`, by default RANGO_SEARCH_BACKEND,
+    # which may also be the dotted path of a SearchBackend subclass.
+    name = name or getattr(settings, 'RANGO_SEARCH_BACKEND', 'bing')
+    if name not in _backends:
+        try:
+            backend_class = import_string(name)
+        except ImportError, e:
+            raise ImproperlyConfigured('Unknown search backend %r: %s' % (name, e))
+        backend = backend_class()
+        backend.name = backend.name or name
+        _backends[name] = backend
+    return _backends[name]
+
+
+def run_query(search_terms, offset=0, results_per_page=10, backend=None):
+    # results_per_page specifies how many results we wish to be returned per page.
+    # Offset specifies where in the results list to start from.
+    # With results_per_page = 10 and offset = 11, this would start from page 2.
+    backend = get_backend(backend)
+
+    # Searches are cached, as with Bing every one of them costs a slow call
+    # and counts against our quota.
+    key = search_cache.key(backend.name, search_terms, offset, results_per_page)
+    results = search_cache.get(key)
+    if results is not None:
+        return results
+
+    # Identical searches running at the same time share one search.
+    try:
+        results = search_flights.do(key, lambda: backend.search(search_terms, offset, results_per_page),
+                                    timeout=getattr(settings, 'RANGO_SEARCH_FLIGHT_TIMEOUT', 10),
+                                    shared=getattr(settings, 'RANGO_SEARCH_SHARED_FLIGHTS', False))
+
+    # The search was refused to spare the search service, so what it last
+    # found is better than nothing. Nothing is cached, as it was not asked.
+    except SearchUnavailable, e:
+        print "Error when searching with %s: %s" % (backend.name, e)
+        return search_cache.get_stale(key) or []
+
+    # Catch a SearchError exception - something went wrong when connecting!
+    # SingleFlightError is the same thing happening in another process.
+    # Results found earlier are still better than none.
+    except (SearchError, SingleFlightError), e:
+        print "Error when searching with %s: %s" % (backend.name, e)
+        results = search_cache.get_stale(key)
+        if results:
+            return results
+        results = []
+
+    # Not cached, as the search may well be about to succeed.
+    except SingleFlightTimeout, e:
+        print "Error when searching with %s: %s" % (backend.name, e)
+        return []
+
+    # Searches that found nothing or failed are only cached briefly.
+    search_cache.set(key, results)
+    return results
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def normalize_query(query):
+    # Searches differing only in case and spacing share one entry.
+    return u' '.join(query.lower().split())
+
+
+def _size(results):
+    # Rough memory use of a results list: the length of its strings.
+    return sum(len(value) for result in results for value in result.values()) + 64
+
+
+class ResultCache(object):
+    """
+    Search results cached per process, keyed by (backend, normalized query,
+    offset, results per page). Entries expire after RANGO_SEARCH_CACHE_TIMEOUT
+    seconds, or RANGO_SEARCH_CACHE_NEGATIVE_TIMEOUT seconds for searches
+    that found nothing or failed. Past RANGO_SEARCH_CACHE_MAX_ENTRIES entries
+    or RANGO_SEARCH_CACHE_MAX_BYTES bytes of results, the least recently used
+    entries are evicted. Expired results are kept until evicted, to be
+    served stale while the search service is unavailable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.stats = dict.fromkeys(('hits', 'negative_hits', 'stale_hits', 'misses', 'expired', 'evictions'), 0)
+
+    def _setting(self, name, default):
+        return getattr(settings, 'RANGO_SEARCH_CACHE_' + name, default)
+
+    def key(self, backend, query, offset, count):
+        return backend, normalize_query(query), offset, count
+
+    def get(self, key):
+        # Returns the cached results, or None on a miss.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            # Move it to the most recently used end.
+            self._entries[key] = self._entries.pop(key)
+            self.stats['hits' if entry[0] else 'negative_hits'] += 1
+            return entry[0]
+
+    def get_stale(self, key):
+        # Returns the cached results even if they have expired, or None if
+        # there are none.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry[0]:
+                return None
+            self.stats['stale_hits'] += 1
+            return entry[0]
+
+    def set(self, key, results):
+        if results:
+            timeout = self._setting('TIMEOUT', 60 * 60)
+        else:
+            timeout = self._setting('NEGATIVE_TIMEOUT', 60)
+        if not timeout:
+            return
+
+        size = _size(results)
+        max_entries = self._setting('MAX_ENTRIES', 1000)
+        max_bytes = self._setting('MAX_BYTES', 8 * 1024 * 1024)
+        with self._lock:
+            # Failed searches are cached as finding nothing, which must not
+            # replace results that can still be served stale.
+            old = self._entries.get(key)
+            if old is not None and old[0] and not results:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (results, time.time() + timeout, size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > max_entries or self._bytes > max_bytes):
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for name in self.stats:
+                self.stats[name] = 0
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+
+search_cache = ResultCache()
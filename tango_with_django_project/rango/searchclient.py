@@ -0,0 +1,142 @@
+import httplib
+import socket
+import threading
+
+
+class SearchError(Exception):
+    # The search service could not be reached, or answered with an error.
+    pass
+
+
+class SearchClient(object):
+    """
+    HTTPS client for a search service that keeps connections open between
+    requests. Up to `pool_size` idle connections are kept; each is used by
+    one thread at a time. Connecting may take up to `connect_timeout`
+    seconds, and every read after that up to `read_timeout` seconds.
+    """
+
+    def __init__(self, host, pool_size=4, connect_timeout=3.0, read_timeout=5.0):
+        self.host = host
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._idle = []
+        self.stats = dict.fromkeys(('requests', 'connections', 'reused', 'discarded', 'errors'), 0)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _connect(self):
+        connection = httplib.HTTPSConnection(self.host, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        self._count('connections')
+        return connection
+
+    def _acquire(self):
+        # Returns (connection, whether it was used before).
+        with self._lock:
+            if self._idle:
+                self.stats['reused'] += 1
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+            self.stats['discarded'] += 1
+        connection.close()
+
+    def open(self, path, headers=None):
+        """
+        Sends a GET request for `path` and returns the response, to be read
+        as it arrives and closed after. Raises SearchError when the request
+        fails or the status is not 200.
+        """
+        self._count('requests')
+        while True:
+            try:
+                connection, reused = self._acquire()
+            except (socket.error, httplib.HTTPException), e:
+                self._count('errors')
+                raise SearchError('Could not connect to %s: %s' % (self.host, e))
+
+            try:
+                connection.request('GET', path, headers=headers or {})
+                response = SearchResponse(self, connection, connection.getresponse())
+            except (socket.error, httplib.HTTPException), e:
+                connection.close()
+                if reused and not isinstance(e, socket.timeout):
+                    # The server closed the idle connection; try a new one.
+                    continue
+                self._count('errors')
+                raise SearchError('Request to %s failed: %s' % (self.host, e))
+
+            if response.status != 200:
+                self._count('errors')
+                with response:
+                    response.read()
+                raise SearchError('%s answered %d %s' % (self.host, response.status, response.reason))
+            return response
+
+    def get(self, path, headers=None):
+        """
+        Sends a GET request for `path` and returns the response body. Raises
+        SearchError when the request fails or the status is not 200.
+        """
+        with self.open(path, headers) as response:
+            return response.read()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, idle=len(self._idle))
+
+
+class SearchResponse(object):
+    """
+    A response from a SearchClient, read from the connection as it arrives.
+    Closing it gives the connection back to the client once the whole body
+    has been read, and otherwise drops it, as what is left of the body
+    would be in the way of the next response.
+    """
+
+    def __init__(self, client, connection, response):
+        self._client = client
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+
+    def read(self, amt=None):
+        try:
+            return self._response.read(amt)
+        except (socket.error, httplib.HTTPException), e:
+            self._client._count('errors')
+            self.close()
+            raise SearchError('Reading from %s failed: %s' % (self._client.host, e))
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._client._release(connection)
+        else:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
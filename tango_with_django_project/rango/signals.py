@@ -0,0 +1,52 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rango import textindex
+from rango.leaderboards import category_leaderboard, page_leaderboard
+from rango.models import Category, Page
+from rango.suggest import category_suggestions
+from rango.versioning import bump_category_version, bump_content_version
+
+connection_created.connect(textindex.register_functions)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    bump_category_version()
+    bump_content_version()
+    category_leaderboard.update_instance(instance)
+    category_suggestions.update_instance(instance)
+    textindex.index_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_category_version()
+    bump_content_version()
+    category_leaderboard.remove(instance.id)
+    category_suggestions.remove(instance.id)
+    textindex.remove_category(instance.id)
+
+
+def touch_category(category_id):
+    # The category page lists its pages, so it changes with them.
+    # An update query, so the category signals above are not sent.
+    Category.objects.filter(id=category_id).update(last_modified=timezone.now())
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    bump_content_version()
+    touch_category(instance.category_id)
+    page_leaderboard.update_instance(instance)
+    textindex.index_page(instance)
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    bump_content_version()
+    touch_category(instance.category_id)
+    page_leaderboard.remove(instance.id)
+    textindex.remove_page(instance.id)
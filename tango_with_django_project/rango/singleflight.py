@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+# How often a process waiting on a call made by another process looks for its result.
+POLL_INTERVAL = 0.05
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class SingleFlightError(Exception):
+    # The call failed in another process; only its description made it here.
+    pass
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Makes concurrent calls for the same key share one call. The first caller
+    runs the function, and callers arriving while it runs wait for it and get
+    its result, or its exception. A waiter gives up after `timeout` seconds
+    with SingleFlightTimeout.
+
+    With shared=True, processes coordinate through the cache too: the caller
+    that runs the function holds a lock in the cache and leaves the outcome
+    there for the other processes. This needs a cache shared between them,
+    such as memcached.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=10, shared=False):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise SingleFlightTimeout('Gave up waiting for %s %r' % (self.name, key))
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if shared:
+                call.result = self._do_shared(key, func, timeout)
+            else:
+                call.result = func()
+        except Exception, e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def shared_keys(self, key):
+        digest = hashlib.md5(repr(key)).hexdigest()
+        prefix = 'rango:flight:%s:%s' % (self.name, digest)
+        return prefix + ':lock', prefix + ':outcome'
+
+    def _do_shared(self, key, func, timeout):
+        lock_key, outcome_key = self.shared_keys(key)
+        deadline = time.time() + timeout
+
+        while True:
+            if cache.add(lock_key, True, timeout):
+                try:
+                    result = func()
+                except Exception, e:
+                    cache.set(outcome_key, ('%s: %s' % (type(e).__name__, e), None), timeout)
+                    raise
+                else:
+                    cache.set(outcome_key, (None, result), timeout)
+                finally:
+                    cache.delete(lock_key)
+                return result
+
+            # Another process is running it. Wait for the outcome, or for the
+            # lock to go away without one, in which case we try to run it.
+            while True:
+                if time.time() >= deadline:
+                    raise SingleFlightTimeout('Gave up waiting for %s %r' % (self.name, key))
+                time.sleep(POLL_INTERVAL)
+
+                outcome = cache.get(outcome_key)
+                if outcome is not None:
+                    error, result = outcome
+                    if error is not None:
+                        raise SingleFlightError(error)
+                    return result
+                if cache.get(lock_key) is None:
+                    break
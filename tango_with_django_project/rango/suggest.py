@@ -0,0 +1,245 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from rango.models import Category
+from rango.versioning import category_version
+
+# Past this many remembered prefixes they are forgotten, and remembered again
+# as they are asked for.
+MAX_REMEMBERED = 10000
+
+# Misspelt names are looked for among the categories sharing the most
+# trigrams with what was typed, at most this many of them.
+MAX_CANDIDATES = 30
+
+# One typo is allowed for every three letters typed, up to this many.
+MAX_TYPOS = 2
+
+
+def trigrams(text, whole=True):
+    # The three letter sequences of a lower-cased text, padded at the start
+    # so the first letters count most, and at the end too for whole words.
+    text = u'  ' + text.lower() + (u' ' if whole else u'')
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+
+def prefix_distance(text, name, limit):
+    # The fewest typos turning text into the start of name, or the whole of
+    # it, or limit + 1 if that takes more than limit. Only the cells of the
+    # edit distance table within limit of its diagonal can be in reach, and
+    # its last row holds the distances to every start of name.
+    width = min(len(name), len(text) + limit)
+    over = limit + 1
+    previous = [j if j <= limit else over for j in xrange(width + 1)]
+    for i, letter in enumerate(text, 1):
+        low, high = max(1, i - limit), min(width, i + limit)
+        current = [over] * (width + 1)
+        if i <= limit:
+            current[0] = i
+        for j in xrange(low, high + 1):
+            # min() of the three, written out as this is the hot loop.
+            cost = previous[j - 1] + (letter != name[j - 1])
+            if previous[j] < cost:
+                cost = previous[j] + 1
+            if current[j - 1] < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        previous = current
+    return min(previous[max(len(text) - limit, 0):] + [over])
+
+
+class CategorySuggestions(object):
+    """
+    The categories whose name or slug starts with a prefix, most liked
+    first, answered from memory in each process.
+
+    The lower-cased names and slugs are kept in a sorted list, so the
+    categories starting with a prefix are a slice of it found by bisection.
+    The top categories of each prefix asked for are remembered until a
+    category changes, as the same few short prefixes are asked for most.
+    For misspelt names, the categories are also indexed by the trigrams of
+    their names (see similar()).
+
+    Categories saved or deleted in this process, and likes written out by
+    it, are applied as they happen. A change of the category version means
+    another process changed a category, and the index is rebuilt on the next
+    lookup, as it is at least every RANGO_SUGGEST_INDEX_TIMEOUT seconds to
+    pick up likes written out elsewhere.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._categories = {}
+        self._trigrams = defaultdict(set)
+        self._top = {}
+        self._version = None
+        self._built = 0
+
+    def _timeout(self):
+        return getattr(settings, 'RANGO_SUGGEST_INDEX_TIMEOUT', 60)
+
+    def _build(self, version):
+        rows = list(Category.objects.values_list('id', 'name', 'slug', 'likes'))
+        self._categories = dict((row[0], row) for row in rows)
+        self._keys = sorted(key for row in rows for key in self._keys_of(row))
+        self._trigrams = defaultdict(set)
+        for row in rows:
+            for trigram in trigrams(row[1]):
+                self._trigrams[trigram].add(row[0])
+        self._top = {}
+        self._version = version
+        self._built = time.time()
+
+    def _keys_of(self, row):
+        id, name, slug = row[:3]
+        return set([(name.lower(), id), (slug.lower(), id)])
+
+    def _current(self):
+        # Rebuild if another process changed a category or the index is old.
+        version = category_version()
+        if self._keys is None or version != self._version or time.time() - self._built >= self._timeout():
+            self._build(version)
+
+    def suggest(self, prefix, count=8):
+        """
+        Returns up to `count` categories whose name or slug starts with
+        `prefix`, ignoring case, most liked first. They are not read from
+        the database and have only their id, name, slug and likes.
+        """
+        prefix = prefix.lower()
+        with self._lock:
+            self._current()
+            ids = self._top.get((prefix, count))
+            if ids is None:
+                if len(self._top) >= MAX_REMEMBERED:
+                    self._top = {}
+                start = bisect.bisect_left(self._keys, (prefix,))
+                end = bisect.bisect_left(self._keys, (prefix + u'\uffff',))
+                matches = set(id for key, id in self._keys[start:end])
+                rows = heapq.nsmallest(count, [self._categories[id] for id in matches],
+                                       key=lambda row: (-row[3], row[1].lower()))
+                ids = self._top[(prefix, count)] = [row[0] for row in rows]
+            rows = [self._categories[id] for id in ids]
+
+        return [Category(id=id, name=name, slug=slug, likes=likes) for id, name, slug, likes in rows]
+
+    def similar(self, text, count=8, exclude=()):
+        """
+        Returns up to `count` categories, other than those in `exclude`,
+        whose name, or its start, is within a few typos of `text`: one for
+        every three letters typed, up to MAX_TYPOS. The closest come first,
+        then the most liked. Texts shorter than three letters match nothing.
+        """
+        text = text.lower()
+        if len(text) < 3:
+            return []
+        limit = min(len(text) // 3, MAX_TYPOS)
+        excluded = set(category.id for category in exclude)
+        with self._lock:
+            self._current()
+            ids = self._top.get(('~', text))
+            if ids is None:
+                if len(self._top) >= MAX_REMEMBERED:
+                    self._top = {}
+
+                # The categories sharing the most trigrams with the text. Each
+                # typo changes at most three of them, so a name within reach
+                # shares at least `least` of them, and so is in one of the
+                # postings of all but least - 1 of its trigrams. Leaving out
+                # the longest postings, the others are only intersected...
+                postings = sorted([self._trigrams.get(trigram, frozenset())
+                                   for trigram in trigrams(text, whole=False)], key=len)
+                least = max(len(postings) - 3 * limit, 1)
+                pool = set().union(*postings[:len(postings) - least + 1])
+                shared = defaultdict(int)
+                for ids in postings:
+                    for id in pool.intersection(ids):
+                        shared[id] += 1
+                candidates = heapq.nlargest(MAX_CANDIDATES, [id for id in shared if shared[id] >= least],
+                                            key=shared.get)
+
+                # ...ranked by how many typos away their name is.
+                ranked = []
+                for id in candidates:
+                    row = self._categories[id]
+                    name = row[1].lower()
+                    distance = prefix_distance(text, name, limit)
+                    if distance <= limit:
+                        ranked.append((distance, -row[3], name, id))
+                ranked.sort()
+                ids = self._top[('~', text)] = [id for distance, likes, name, id in ranked]
+            rows = [self._categories[id] for id in ids if id not in excluded][:count]
+
+        return [Category(id=id, name=name, slug=slug, likes=likes) for id, name, slug, likes in rows]
+
+    def _remove(self, id):
+        row = self._categories.pop(id, None)
+        if row is not None:
+            for key in self._keys_of(row):
+                del self._keys[bisect.bisect_left(self._keys, key)]
+            for trigram in trigrams(row[1]):
+                ids = self._trigrams[trigram]
+                ids.discard(id)
+                if not ids:
+                    del self._trigrams[trigram]
+
+    def _add(self, row):
+        self._remove(row[0])
+        self._categories[row[0]] = row
+        for key in self._keys_of(row):
+            bisect.insort(self._keys, key)
+        for trigram in trigrams(row[1]):
+            self._trigrams[trigram].add(row[0])
+
+    def _apply(self, change, bumped):
+        # Applies a change made in this process. When it `bumped` the
+        # category version, any other bump since the index was built means
+        # a change made elsewhere, which only a rebuild picks up.
+        with self._lock:
+            if self._keys is None:
+                return
+            if bumped:
+                # Without a shared cache there is no version to go by.
+                version = category_version()
+                if version is None or self._version != version - 1:
+                    self._keys = None
+                    return
+                self._version = version
+            change()
+            self._top = {}
+
+    def update_instance(self, category):
+        # Called once the category version was bumped for the save.
+        row = (category.id, category.name, category.slug, category.likes)
+        self._apply(lambda: self._add(row), True)
+
+    def remove(self, id):
+        self._apply(lambda: self._remove(id), True)
+
+    def refresh(self, ids):
+        # Re-reads the likes of categories changed with an UPDATE query,
+        # which does not bump the category version.
+        rows = list(Category.objects.filter(id__in=list(ids)).values_list('id', 'name', 'slug', 'likes'))
+
+        def change():
+            for row in rows:
+                self._add(row)
+        self._apply(change, False)
+
+    def clear(self):
+        with self._lock:
+            self._keys = None
+            self._categories = {}
+            self._trigrams = defaultdict(set)
+            self._top = {}
+
+
+category_suggestions = CategorySuggestions()
@@ -1,8 +1,34 @@
 from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from rango.models import Category
+from rango.pagecache import render_fragment
+from rango.versioning import category_version
 
 register = template.Library()
 
-@register.inclusion_tag('rango/cats.html')
+@register.simple_tag
 def get_category_list(cat=None):
-    return {'cats': Category.objects.all(), 'act_cat': cat}
\ No newline at end of file
+    # The list is rendered once per version of the categories and cached,
+    # so pages do not scan the categories and reverse their urls every time.
+    key = 'rango:sidebar:%s' % category_version()
+    sidebar = cache.get(key)
+    if sidebar is None:
+        sidebar = render_to_string('rango/cats.html', {'cats': Category.objects.all(), 'act_cat': None})
+        cache.set(key, sidebar, getattr(settings, 'RANGO_CACHE_TIMEOUT', 24 * 60 * 60))
+
+    # Highlight the active category in the cached list.
+    if cat:
+        url = reverse('category', args=[cat.slug])
+        sidebar = sidebar.replace('<li><a href="%s">' % url, '<li class="active"><a href="%s">' % url, 1)
+
+    return mark_safe(sidebar)
+
+@register.simple_tag(takes_context=True)
+def fragment(context, template_name):
+    # Renders a part of the page that changes on every visit, marked so it
+    # can be rendered again into a cached copy of the page (see rango.pagecache).
+    return mark_safe(render_fragment(template_name, context))
@@ -0,0 +1,30 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class RangoTestRunner(DiscoverRunner):
+    """
+    Runs the tests with counts written out straight away, no click log and
+    no cache. The database is rolled back after every test, so nothing may
+    stay buffered or cached from one test to the next, and the tests must
+    not write logs or pid files into the project. Tests of the buffers, the click log and
+    the caches turn them back on with override_settings.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(RangoTestRunner, self).setup_test_environment(**kwargs)
+        self.test_settings = override_settings(
+            RANGO_COUNTER_FLUSH_INTERVAL=0,
+            RANGO_CLICK_LOG_DIR=None,
+            RANGO_COUNTER_PID_DIR=None,
+            CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+                }
+            },
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super(RangoTestRunner, self).teardown_test_environment(**kwargs)
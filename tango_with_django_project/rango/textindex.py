@@ -0,0 +1,131 @@
+import math
+import re
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+# An SQLite FTS5 table over the names of categories and the titles and urls
+# of pages, with the name of their category. Categories are stored under
+# rowid 2 * id and pages under 2 * id + 1, so a row is found by its rowid
+# rather than by scanning the table. View counts are read from the category
+# and page tables when searching, so they need not be kept up to date here.
+
+CREATE_SQL = ("CREATE VIRTUAL TABLE IF NOT EXISTS rango_textindex USING fts5("
+              "title, url, category, tokenize = 'unicode61 remove_diacritics 1', prefix = '2 3')")
+
+# How much a match in each column counts, for bm25().
+TITLE_WEIGHT = 10.0
+URL_WEIGHT = 2.0
+CATEGORY_WEIGHT = 1.0
+
+# Scores are multiplied by 1 + VIEWS_WEIGHT * log(1 + views), so popular
+# pages come first among equally good matches without burying better ones.
+VIEWS_WEIGHT = 0.1
+
+SEARCH_SQL = """
+    SELECT t.rowid, c.name, c.slug, c.views, p.title, p.url, pc.name
+    FROM rango_textindex t
+    LEFT JOIN rango_category c ON (t.rowid & 1) = 0 AND c.id = t.rowid / 2
+    LEFT JOIN rango_page p ON (t.rowid & 1) = 1 AND p.id = t.rowid / 2
+    LEFT JOIN rango_category pc ON pc.id = p.category_id
+    WHERE rango_textindex MATCH %%s
+    ORDER BY bm25(rango_textindex, %s, %s, %s) * (1 + %s * rango_log1p(COALESCE(c.views, p.views))), t.rowid
+    LIMIT %%s OFFSET %%s
+""" % (TITLE_WEIGHT, URL_WEIGHT, CATEGORY_WEIGHT, VIEWS_WEIGHT)
+
+
+def enabled():
+    # The index needs SQLite built with FTS5; elsewhere there is nothing to search.
+    if connection.vendor != 'sqlite':
+        return False
+    connection.ensure_connection()
+    return connection.rango_fts5
+
+
+def register_functions(sender, connection, **kwargs):
+    # Connected to connection_created: SQLite has no logarithm of its own.
+    # Also notes whether this SQLite has FTS5, which not every build does.
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('rango_log1p', 1, lambda value: math.log1p(max(value or 0, 0)))
+        options = [row[0] for row in connection.connection.execute('PRAGMA compile_options')]
+        connection.rango_fts5 = 'ENABLE_FTS5' in options
+
+
+def create(cursor):
+    cursor.execute(CREATE_SQL)
+
+
+def drop(cursor):
+    cursor.execute('DROP TABLE IF EXISTS rango_textindex')
+
+
+def rebuild(cursor):
+    # Refills the index from the category and page tables.
+    cursor.execute('DELETE FROM rango_textindex')
+    cursor.execute("INSERT INTO rango_textindex (rowid, title, url, category) "
+                   "SELECT id * 2, name, '', '' FROM rango_category")
+    cursor.execute("INSERT INTO rango_textindex (rowid, title, url, category) "
+                   "SELECT p.id * 2 + 1, p.title, p.url, c.name "
+                   "FROM rango_page p JOIN rango_category c ON c.id = p.category_id")
+
+
+def index_category(category):
+    # Indexes the category, and its pages again as they carry its name.
+    if not enabled():
+        return
+    cursor = connection.cursor()
+    cursor.execute("INSERT OR REPLACE INTO rango_textindex (rowid, title, url, category) VALUES (%s, %s, '', '')",
+                   [category.id * 2, category.name])
+    cursor.execute("INSERT OR REPLACE INTO rango_textindex (rowid, title, url, category) "
+                   "SELECT id * 2 + 1, title, url, %s FROM rango_page WHERE category_id = %s",
+                   [category.name, category.id])
+
+
+def index_page(page):
+    if not enabled():
+        return
+    connection.cursor().execute(
+        "INSERT OR REPLACE INTO rango_textindex (rowid, title, url, category) "
+        "SELECT %s, %s, %s, name FROM rango_category WHERE id = %s",
+        [page.id * 2 + 1, page.title, page.url, page.category_id])
+
+
+def remove_category(category_id):
+    if enabled():
+        connection.cursor().execute('DELETE FROM rango_textindex WHERE rowid = %s', [category_id * 2])
+
+
+def remove_page(page_id):
+    if enabled():
+        connection.cursor().execute('DELETE FROM rango_textindex WHERE rowid = %s', [page_id * 2 + 1])
+
+
+def match_expression(query):
+    # Every word must match, the last one also as the start of a longer word
+    # so results come up while it is being typed. Only letters and digits
+    # are kept, so the query cannot use FTS5 syntax.
+    words = re.findall(r'\w+', query, re.UNICODE)
+    if not words:
+        return None
+    return ' '.join(['"%s"' % word for word in words[:-1]] + ['"%s"*' % words[-1]])
+
+
+def search(query, offset=0, limit=10):
+    """
+    Returns up to `limit` categories and pages matching `query`, skipping
+    the first `offset`, best first, as dicts of title, link and summary.
+    """
+    expression = match_expression(query)
+    if expression is None or not enabled():
+        return []
+
+    cursor = connection.cursor()
+    cursor.execute(SEARCH_SQL, [expression, limit, offset])
+    results = []
+    for rowid, name, slug, views, title, url, category_name in cursor.fetchall():
+        if rowid % 2 == 0:
+            results.append({'title': name, 'link': reverse('category', args=[slug]),
+                            'summary': 'Category with %d views' % views})
+        else:
+            results.append({'title': title, 'link': url, 'summary': 'Page in %s' % category_name})
+    return results
@@ -0,0 +1,137 @@
+"""
+Time-decayed popularity scores for categories and pages.
+
+Every like or click adds 2 ** (t / half_life) to the object's score, where t
+is the time of the event. Older events are then worth exponentially less than
+new ones, and since all scores grow by the same factor over time, ordering by
+the stored score is the same as ordering by the decayed score right now.
+So a score only changes when something happens to its object, and nothing has
+to be recomputed in batches.
+
+To keep the weights within range of a float, time is split into eras of
+ERA_HALF_LIVES half-lives and weights are relative to the start of the era.
+A score from the previous era is rescaled the next time it is bumped, and
+scores from before that have decayed to nothing.
+"""
+import calendar
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rango.counters import WriteBehindBuffer
+from rango.models import TrendingScore
+
+ERA_HALF_LIVES = 128
+ERA_SCALE = 2.0 ** -ERA_HALF_LIVES
+BUMP_ATTEMPTS = 5
+
+
+def era_weight(now=None):
+    # The current era and the weight of an event happening now.
+    now = now or timezone.now()
+    half_life = getattr(settings, 'RANGO_TRENDING_HALF_LIFE', 24 * 60 * 60)
+    t = calendar.timegm(now.utctimetuple()) / float(half_life)
+    era = int(t // ERA_HALF_LIVES)
+    return era, 2.0 ** (t - era * ERA_HALF_LIVES)
+
+
+def bump(kind, object_id, era, weight):
+    scores = TrendingScore.objects.filter(kind=kind, object_id=object_id)
+    for attempt in xrange(BUMP_ATTEMPTS):
+        if scores.filter(era=era).update(score=F('score') + weight):
+            return
+
+        # Last bumped in the previous era, so rescale the score into this one.
+        if scores.filter(era=era - 1).update(score=F('score') * ERA_SCALE + weight, era=era):
+            return
+
+        # Anything older is worth less than 2 ** -128 of an event now.
+        if scores.filter(era__lt=era - 1).update(score=weight, era=era):
+            return
+
+        # Already bumped in a later era, e.g. by a buffer written out before
+        # this one, so scale the weight down into that era instead.
+        later_era = scores.filter(era__gt=era).values_list('era', flat=True).first()
+        if later_era is not None:
+            if scores.filter(era=later_era).update(score=F('score') + weight * ERA_SCALE ** (later_era - era)):
+                return
+            continue
+
+        try:
+            with transaction.atomic():
+                TrendingScore.objects.create(kind=kind, object_id=object_id, era=era, score=weight)
+            return
+        except IntegrityError:
+            # Somebody else created the row meanwhile; go round and bump it.
+            pass
+
+    raise IntegrityError('Could not bump the trending score of %s %s' % (kind, object_id))
+
+
+class TrendingBuffer(WriteBehindBuffer):
+    # Buffers weighted events, keyed by (kind, object_id, era).
+    name = 'trending'
+
+    def write(self, batch):
+        with transaction.atomic():
+            for (kind, object_id, era), weight in batch.items():
+                bump(kind, object_id, era, weight)
+
+
+trending_buffer = TrendingBuffer()
+
+
+def record_trending(kind, object_id, amount=1):
+    era, weight = era_weight()
+    trending_buffer.add((kind, object_id, era), amount * weight)
+
+
+def current_scores(kind, object_ids):
+    # Scores of the given objects, scaled to the current era.
+    era, weight = era_weight()
+    scores = TrendingScore.objects.filter(kind=kind, object_id__in=object_ids, era__gte=era - 1)
+
+    result = {}
+    for object_id, score_era, score in scores.values_list('object_id', 'era', 'score'):
+        result[object_id] = score if score_era == era else score * ERA_SCALE
+    return result
+
+
+def top_trending_ids(kind, limit):
+    # Read the top of the current and the previous era off the
+    # (kind, era, score) index and merge them: 2 queries of `limit` rows.
+    era, weight = era_weight()
+    scores = TrendingScore.objects.filter(kind=kind)
+
+    top = []
+    for score_era, scale in ((era, 1.0), (era - 1, ERA_SCALE)):
+        for object_id, score in scores.filter(era=score_era).order_by('-score').values_list('object_id', 'score')[:limit]:
+            top.append((score * scale, object_id))
+
+    top.sort(reverse=True)
+    return [object_id for score, object_id in top[:limit]]
+
+
+def top_trending(model, kind, limit, fallback):
+    """
+    The `limit` most popular objects of `model` right now. When fewer than
+    `limit` objects have a score, the rest is filled from the queryset
+    `fallback`, in its own order.
+    """
+    ids = top_trending_ids(kind, limit)
+    objects = model.objects.in_bulk(ids)
+    result = [objects[id] for id in ids if id in objects]
+
+    if len(result) < limit:
+        result.extend(fallback.exclude(id__in=ids)[:limit - len(result)])
+    return result
+
+
+def order_by_trending(kind, objects):
+    # Sort a list of objects, e.g. the pages of one category, by their score.
+    objects = list(objects)
+    scores = current_scores(kind, [obj.id for obj in objects])
+    objects.sort(key=lambda obj: scores.get(obj.id, 0), reverse=True)
+    return objects
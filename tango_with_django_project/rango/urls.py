@@ -14,7 +14,10 @@ urlpatterns = patterns('',
         url(r'^goto/$', views.track_url, name='goto'),
         url(r'^like_category/$', views.like_category, name='like_category'),
         url(r'^category_search/$', views.category_search, name='category_search'),
+        url(r'^site_search/$', views.site_search, name='site_search'),
         url(r'^suggest_category/$', views.suggest_category, name='suggest_category'),
+        url(r'^suggest_categories/$', views.suggest_categories, name='suggest_categories'),
+        url(r'^search_status/$', views.search_status, name='search_status'),
         url(r'^edit_profile/$', views.edit_profile, name='edit_profile'),
         url(r'^profile/(?P<username>[\w\-]+)/$', views.profile, name='profile'),
         url(r'^users_profiles/$', views.users_profiles, name='users_profiles'),
@@ -0,0 +1,47 @@
+import time
+
+from django.core.cache import cache
+
+# Cached data derived from the categories is stored under keys that include
+# this version stamp. Saving or deleting a category bumps the stamp, which
+# makes every cached copy stale at once without having to find and delete it.
+CATEGORY_VERSION_KEY = 'rango:category-version'
+
+# The same for cached pages, which show both categories and pages.
+CONTENT_VERSION_KEY = 'rango:content-version'
+
+
+def _new_version():
+    # Start from the clock, so a stamp lost from the cache is not reused.
+    return int(time.time() * 1000)
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def category_version():
+    return _version(CATEGORY_VERSION_KEY)
+
+
+def bump_category_version():
+    _bump(CATEGORY_VERSION_KEY)
+
+
+def content_version():
+    return _version(CONTENT_VERSION_KEY)
+
+
+def bump_content_version():
+    _bump(CONTENT_VERSION_KEY)
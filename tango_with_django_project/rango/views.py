@@ -1,80 +1,104 @@
-from datetime import datetime
+import hashlib
+import json
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseNotModified, HttpResponseRedirect
 from django.shortcuts import render
-from rango.bing_search import run_query
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.cache import never_cache
+from rango import textindex
+from rango.bing_search import get_search_client
+from rango.breaker import search_breaker, search_rate_limit
+from rango.activity import record_activity
+from rango.clicklog import CATEGORY_LIKE, CATEGORY_VIEW, PAGE_CLICK, log_event
+from rango.conditional import category_validators, not_modified, set_validators
+from rango.counters import category_likes, record_category_like
+from rango.counters import category_views, record_category_view
+from rango.counters import record_page_click, with_pending_views
+from rango.fanout import fan_out, prefetch
 from rango.forms import CategoryForm
+from rango.leaderboards import category_leaderboard, page_leaderboard
 from rango.forms import PageForm
 from rango.models import Category
 from rango.models import Page, User, UserProfile
+from rango.models import ActivityBucket, TrendingScore, UniqueVisitorSketch
+from rango.pagecache import cache_page, cached_response, get_cached_page
+from rango.search import get_backend, run_query
+from rango.searchcache import search_cache
+from rango.suggest import category_suggestions
+from rango.trending import order_by_trending, record_trending, top_trending
+from rango.visitors import record_unique_visitor, unique_visitors
+from rango.visits import count_visit, read_visits, set_visits_cookie
 from django.shortcuts import redirect
 
 
 
 def index(request):
+    # Get the number of visits to the site.
+    # The count is kept in a signed cookie rather than in the session, so that
+    # counting visits does not cost a session lookup and write on every hit.
+    # It goes up by one on the first visit of each day.
+    visits, visits_changed = count_visit(request)
+
+    # Anonymous visitors get the cached page, with only their visit count filled in.
+    page = get_cached_page(request)
+    if page is not None:
+        response = cached_response(page, {'rango/visits.html': {'visits': visits}})
+        if visits_changed:
+            set_visits_cookie(response, visits)
+        return response
+
     # Query the database for a list of ALL categories currently stored.
     # Order the categories by no. likes in descending order.
     # Retrieve the top 5 only - or all if less than 5.
     # Place the list in our context_dict dictionary which will be passed to the template engine.
-    category_list = Category.objects.order_by('-likes')[:5]
-    page_list = Page.objects.order_by('-views')[:5]
-    context_dict = {'categories': category_list, 'pages': page_list}
-
-    # Get the number of visits to the site.
-    # We use the COOKIES.get() function to obtain the visits cookie.
-    # If the cookie exists, the value returned is casted to an integer.
-    # If the cookie doesn't exist, we default to zero and cast that.
-    visits = request.session.get('visits')
-    if not visits:
-        visits = 1
-    reset_last_visit_time = False
-
-    last_visit = request.session.get('last_visit')
-    if last_visit:
-        last_visit_time = datetime.strptime(last_visit[:-7], "%Y-%m-%d %H:%M:%S")
-
-        if (datetime.now() - last_visit_time).days > 0:
-            # ...reassign the value of the cookie to +1 of what it was before...
-            visits = visits + 1
-            # ...and update the last visit cookie, too.
-            reset_last_visit_time = True
+    # With ?order=trending, rank by recent likes and clicks instead.
+    order = request.GET.get('order')
+    if order == 'trending':
+        category_list = top_trending(Category, TrendingScore.CATEGORY, 5, Category.objects.order_by('-likes'))
+        page_list = top_trending(Page, TrendingScore.PAGE, 5, Page.objects.order_by('-views'))
     else:
-        # Cookie last_visit doesn't exist, so create it to the current date/time.
-        reset_last_visit_time = True
-
-    if reset_last_visit_time:
-        request.session['last_visit'] = str(datetime.now())
-        request.session['visits'] = visits
+        # The top 5 lists are kept up to date in the cache as likes and views change.
+        category_list = category_leaderboard.top()
+        page_list = page_leaderboard.top()
+    context_dict = {'categories': category_list, 'pages': page_list, 'order': order}
     context_dict['visits'] = visits
 
-
     response = render(request,'rango/index.html', context_dict)
+    cache_page(request, response)
+    if visits_changed:
+        set_visits_cookie(response, visits)
 
     return response
 
 def about(request):
 
+    # Read the visits counted by the index page.
+    # If there are none, we haven't visited the site so the count is zero.
+    visits, last_visit_day = read_visits(request)
+
+    page = get_cached_page(request)
+    if page is not None:
+        return cached_response(page, {'rango/visits.html': {'visits': visits}})
+
     # Construct a dictionary to pass to the template engine as its context.
     # Note the key boldmessage is the same as {{ boldmessage }} in the template!
     context_dict = {'standardmessage': "This tutorial has been put together by Enzo Roiz, 2161561."}
-    
-    # If the visits session varible exists, take it and use it.
-    # If it doesn't, we haven't visited the site so set the count to zero.
-    if request.session.get('visits'):
-        visits = request.session.get('visits')
-    else:
-        visits = 0
-    
     context_dict['visits'] = visits
 
     # Return a rendered response to send to the client.
     # We make use of the shortcut function to make our lives easier.
     # Note that the first parameter is the template we wish to use.
 
-    return render(request, 'rango/about.html', context_dict)
+    response = render(request, 'rango/about.html', context_dict)
+    cache_page(request, response)
+    return response
 
 def category(request, category_name_slug):
 
@@ -87,7 +111,7 @@ def category(request, category_name_slug):
         query = request.POST['query'].strip()
 
         if query:
-            # Run our Bing function to get the results list!
+            # Run our search function to get the results list!
             result_list = run_query(query)
 
             context_dict['result_list'] = result_list
@@ -100,17 +124,42 @@ def category(request, category_name_slug):
         category = Category.objects.get(slug=category_name_slug)
         context_dict['category_name'] = category.name
 
-        # Count the category views
-        try:
-            category.views = category.views + 1
-            category.save()
-        except:
-            pass
+        # Count the category view on one of its shards, then show the live total.
+        record_category_view(category)
+        log_event(CATEGORY_VIEW, category.id, request.user)
+        record_activity(ActivityBucket.CATEGORY_VIEWS, category.id)
+        record_unique_visitor(UniqueVisitorSketch.CATEGORY, category.id, request)
+
+        category.likes = category_likes(category)
+        context_dict['unique_visitors'] = unique_visitors(UniqueVisitorSketch.CATEGORY, category.id)
 
         # Retrieve all of the associated pages.
         # Note that filter returns >= 1 model instance.
         pages = Page.objects.filter(category=category).order_by('-views')
 
+        # Clicks are written out in batches, so fold in the ones still waiting.
+        pages = with_pending_views(pages)
+
+        # With ?order=trending, show the most popular pages right now first.
+        context_dict['order'] = request.GET.get('order')
+        if context_dict['order'] == 'trending':
+            pages = order_by_trending(TrendingScore.PAGE, pages)
+
+        # Browsers and proxies that have the page already only need to hear it is unchanged.
+        # The view is counted above, so it counts on these answers too.
+        etag, last_modified = category_validators(category, request.user, pages, context_dict['unique_visitors'])
+        if not_modified(request, etag, last_modified):
+            return set_validators(HttpResponseNotModified(), etag, last_modified)
+
+        category.views = category_views(category)
+
+        # Anonymous visitors get the cached page, with only the view count filled in,
+        # as long as nothing else on it has changed.
+        page = get_cached_page(request, etag)
+        if page is not None:
+            response = cached_response(page, {'rango/category_views.html': {'category': category}})
+            return set_validators(response, etag, last_modified)
+
         # Adds our results list to the template context under name pages.
         context_dict['pages'] = pages
         # We also add the category object from the database to the context dictionary.
@@ -129,7 +178,11 @@ def category(request, category_name_slug):
         context_dict['query'] = category.name
 
     # Go render the response and return it to the client.
-    return render(request, 'rango/category.html', context_dict)
+    response = render(request, 'rango/category.html', context_dict)
+    cache_page(request, response, etag)
+    if request.method == 'GET':
+        set_validators(response, etag, last_modified)
+    return response
 
 @login_required
 def add_category(request):
@@ -296,18 +349,56 @@ def add_page(request, category_name_slug):
 def restricted(request):
     return render(request, 'rango/restricted.html')
 
+SEARCH_RESULTS_PER_PAGE = 10
+
+def search_page(data):
+    # The page of search results asked for, counting from 1.
+    try:
+        return max(int(data.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
 def search(request):
 
     result_list = []
+    query = ''
+    page = 1
+    has_next = False
 
     if request.method == 'POST':
         query = request.POST['query'].strip()
+        page = search_page(request.POST)
 
         if query:
-            # Run our Bing function to get the results list!
-            result_list = run_query(query)
+            # Run our search function to get the results list!
+            offset = (page - 1) * SEARCH_RESULTS_PER_PAGE
+            result_list = run_query(query, offset, SEARCH_RESULTS_PER_PAGE)
+
+            # Get the next page ready while this one is being read.
+            has_next = len(result_list) >= SEARCH_RESULTS_PER_PAGE
+            if has_next and getattr(settings, 'RANGO_SEARCH_PREFETCH', True):
+                prefetch(query, [get_backend().name], offset + SEARCH_RESULTS_PER_PAGE, SEARCH_RESULTS_PER_PAGE)
+
+    return render(request, 'rango/search.html', {'result_list': result_list, 'query': query,
+                                                 'page': page, 'has_next': has_next})
+
+def site_search(request):
+    # Searches our own categories and pages through the full-text index.
+    # It answers in milliseconds, so results are not cached.
+    query = request.GET.get('query', '').strip()
+    page = search_page(request.GET)
+    result_list = []
+    has_next = False
+
+    if query:
+        # One more result than shown tells whether there is a next page.
+        offset = (page - 1) * SEARCH_RESULTS_PER_PAGE
+        result_list = textindex.search(query, offset, SEARCH_RESULTS_PER_PAGE + 1)
+        has_next = len(result_list) > SEARCH_RESULTS_PER_PAGE
+        result_list = result_list[:SEARCH_RESULTS_PER_PAGE]
 
-    return render(request, 'rango/search.html', {'result_list': result_list})
+    return render(request, 'rango/site_search.html', {'result_list': result_list, 'query': query,
+                                                      'page': page, 'has_next': has_next})
 
 # Use the login_required() decorator to ensure only those logged in can access the view.
 # @login_required
@@ -326,10 +417,14 @@ def track_url(request):
             page_id = request.GET['page_id']
             try:
                 page = Page.objects.get(id=page_id)
-                page.views = page.views + 1
-                page.save()
+                # Buffer the click; it is written out with the next batch.
+                record_page_click(page.id)
+                log_event(PAGE_CLICK, page.id, request.user)
+                record_activity(ActivityBucket.PAGE_CLICKS, page.id)
+                record_trending(TrendingScore.PAGE, page.id)
+                record_unique_visitor(UniqueVisitorSketch.PAGE, page.id, request)
                 url = page.url
-            except:
+            except (Page.DoesNotExist, ValueError):
                 pass
 
     return redirect(url)
@@ -345,9 +440,11 @@ def like_category(request):
     if cat_id:
         cat = Category.objects.get(id=int(cat_id))
         if cat:
-            likes = cat.likes + 1
-            cat.likes =  likes
-            cat.save()
+            # Record the like in the ledger; it is added to cat.likes in batches.
+            if record_category_like(request.user, cat):
+                record_trending(TrendingScore.CATEGORY, cat.id)
+                log_event(CATEGORY_LIKE, cat.id, request.user)
+            likes = category_likes(cat)
 
     return HttpResponse(likes)
 
@@ -359,41 +456,82 @@ def category_search(request):
     if request.method == 'GET':
         query = request.GET['query'].strip()
         if query:
-            # Run our Bing function to get the results list!
-            result_list = run_query(query)
+            # Search the web, the news and our own pages at the same time.
+            page = search_page(request.GET)
+            result_list = fan_out(query, results_per_source=SEARCH_RESULTS_PER_PAGE, page=page)
 
             context_dict['result_list'] = result_list
             context_dict['query'] = query
+            context_dict['page'] = page
+            context_dict['has_next'] = result_list.has_next
 
     return render(request, 'rango/category_search.html', context_dict)
 
 def suggest_category(request):
-
-    def get_category_list(max_results=0, starts_with=''):
-        cat_list = Category.objects.all()
-        if starts_with:
-            cat_list = Category.objects.filter(name__istartswith=starts_with)
-
-        if max_results > 0:
-            if len(cat_list) > max_results:
-                cat_list = cat_list[:max_results]
-
-        return cat_list
-
+    # Answered from the suggestion index in memory (see rango.suggest),
+    # without querying the database.
     starts_with = ''
-    catid = None
     act_cat = None
 
     if request.method == 'GET':
         starts_with = request.GET['suggestion']
         if request.GET['catid'] != '':
-            catid = request.GET['catid']
-            act_cat = Category.objects.get(id=catid)
+            # Categories are compared by id, so this one need not be loaded.
+            act_cat = Category(id=int(request.GET['catid']))
+
+    cats = category_suggestions.suggest(starts_with, 8)
 
-    cats = get_category_list(8, starts_with)
+    # Fill up with categories whose names were probably misspelt.
+    if len(cats) < 8:
+        cats += category_suggestions.similar(starts_with, 8 - len(cats), exclude=cats)
 
     return render(request, 'rango/cats.html', {'cats': cats, 'act_cat': act_cat })
 
+SUGGESTIONS = 8
+
+def suggest_categories(request):
+    """
+    The sidebar filter's suggestions as JSON: the categories starting with
+    `prefix` and, if there are fewer than 8, those probably misspelt, as
+    [id, name, slug] lists. `complete` tells the client every category
+    starting with the prefix is listed, so it can narrow the prefix itself.
+    """
+    prefix = request.GET.get('prefix', '')
+    matches = category_suggestions.suggest(prefix, SUGGESTIONS + 1)
+    complete = len(matches) <= SUGGESTIONS
+    matches = matches[:SUGGESTIONS]
+    similar = []
+    if len(matches) < SUGGESTIONS:
+        similar = category_suggestions.similar(prefix, SUGGESTIONS - len(matches), exclude=matches)
+
+    body = json.dumps({'prefix': prefix, 'complete': complete,
+                       'categories': [[c.id, c.name, c.slug] for c in matches],
+                       'similar': [[c.id, c.name, c.slug] for c in similar]}, separators=(',', ':'))
+
+    # The same for everyone, so browsers and proxies may keep it briefly,
+    # and then check it is unchanged rather than fetch it again.
+    etag = hashlib.md5(body).hexdigest()
+    if not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'RANGO_SUGGEST_MAX_AGE', 60))
+    return response
+
+@staff_member_required
+@never_cache
+def search_status(request):
+    """
+    For operators: the state of the Bing circuit breaker and rate limit,
+    the search result cache and the pooled Bing connections, as JSON. They
+    are kept per process, so this is the state of the process answering.
+    """
+    body = json.dumps({'breaker': search_breaker.info(), 'rate_limit': search_rate_limit.info(),
+                       'cache': search_cache.info(), 'connections': get_search_client().info()},
+                      sort_keys=True, indent=2)
+    return HttpResponse(body, content_type='application/json')
+
 @login_required
 def edit_profile(request):
     # Get actual user
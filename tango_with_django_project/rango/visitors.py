@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rango.hyperloglog import HyperLogLog
+from rango.models import UniqueVisitorSketch
+
+# Today's sketches, as (kind, object_id) -> (sketch, time loaded). A visit
+# only writes to the database when it changes a register of the sketch, and
+# a sketch is re-read after RANGO_COUNTER_FLUSH_INTERVAL seconds to pick up
+# registers set by other processes. Only the RANGO_VISITOR_SKETCHES most
+# recently visited are kept; every change is saved as it is made, so the
+# sketches dropped are only read again.
+_lock = threading.Lock()
+_sketches = OrderedDict()
+_day = None
+
+
+def visitor_id(request):
+    if request.user.is_authenticated():
+        return 'user:%d' % request.user.id
+    return 'anon:%s|%s' % (request.META.get('REMOTE_ADDR', ''), request.META.get('HTTP_USER_AGENT', ''))
+
+
+def _stored(kind, object_id, day):
+    return UniqueVisitorSketch.objects.filter(kind=kind, object_id=object_id, day=day)
+
+
+def _load(kind, object_id, day):
+    registers = _stored(kind, object_id, day).values_list('registers', flat=True)[:1]
+    if registers:
+        return HyperLogLog(registers[0])
+    return HyperLogLog()
+
+
+def _save(kind, object_id, day, sketch):
+    # Merge with the stored registers first, so registers set by other
+    # processes since we loaded the sketch are kept.
+    stored = _stored(kind, object_id, day)
+    with transaction.atomic():
+        registers = stored.select_for_update().values_list('registers', flat=True)[:1]
+        if registers:
+            sketch.merge(HyperLogLog(registers[0]))
+            stored.update(registers=sketch.to_bytes())
+            return
+
+        try:
+            with transaction.atomic():
+                UniqueVisitorSketch.objects.create(kind=kind, object_id=object_id, day=day,
+                                                   registers=sketch.to_bytes())
+        except IntegrityError:
+            # Another process stored the first sketch of the day meanwhile.
+            _save(kind, object_id, day, sketch)
+
+
+def record_unique_visitor(kind, object_id, request):
+    global _day
+    day = timezone.now().date()
+    interval = getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5)
+
+    with _lock:
+        if day != _day:
+            _sketches.clear()
+            _day = day
+        cached = _sketches.get((kind, object_id))
+
+    if cached and time.time() - cached[1] < interval:
+        sketch, loaded = cached
+    else:
+        sketch, loaded = _load(kind, object_id, day), time.time()
+
+    if sketch.add(visitor_id(request)):
+        _save(kind, object_id, day, sketch)
+
+    with _lock:
+        # Move it to the most recently visited end, and drop the least recent.
+        _sketches.pop((kind, object_id), None)
+        _sketches[(kind, object_id)] = (sketch, loaded)
+        while len(_sketches) > getattr(settings, 'RANGO_VISITOR_SKETCHES', 1000):
+            _sketches.popitem(last=False)
+
+
+def reset():
+    # Forgets the cached sketches, so the next visits read them again.
+    global _day
+    with _lock:
+        _sketches.clear()
+        _day = None
+
+
+def unique_visitors(kind, object_id, days=30):
+    # Estimated distinct visitors over the last `days` days, today included.
+    since = timezone.now().date() - timedelta(days=days - 1)
+    sketch = HyperLogLog()
+    for registers in UniqueVisitorSketch.objects.filter(
+            kind=kind, object_id=object_id, day__gte=since).values_list('registers', flat=True):
+        sketch.merge(HyperLogLog(registers))
+    return sketch.count()
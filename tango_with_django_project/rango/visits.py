@@ -0,0 +1,80 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+
+# The visit counter lives in a signed cookie holding "<visits>:<epoch day>",
+# so counting visits never reads or writes the session store.
+VISITS_COOKIE = 'rango_visits'
+VISITS_SALT = 'rango.visits'
+VISITS_MAX_AGE = 365 * 24 * 60 * 60
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def epoch_day(timestamp=None):
+    return int((timestamp or time.time()) // SECONDS_PER_DAY)
+
+
+def visits_cookie_value(visits, day):
+    # The cookie value as set_signed_cookie() would store it.
+    return signing.get_cookie_signer(salt=VISITS_COOKIE + VISITS_SALT).sign('%d:%d' % (visits, day))
+
+
+def _read_session(request):
+    # Visitors from before the cookie have their count in the session, with
+    # last_visit stored as str(datetime.now()). Only look there if they sent a
+    # session cookie, so nobody else costs a session lookup.
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return 0, None
+
+    visits = request.session.get('visits') or 0
+    last_visit = request.session.get('last_visit')
+    day = None
+    if last_visit:
+        try:
+            last_visit_time = datetime.strptime(last_visit[:19], "%Y-%m-%d %H:%M:%S")
+            day = epoch_day(time.mktime(last_visit_time.timetuple()))
+        except ValueError:
+            pass
+    return visits, day
+
+
+def read_visits(request):
+    """
+    Returns (visits, day of last visit) for the visitor, from the visits
+    cookie, or from the session for visitors who do not have the cookie yet.
+    Returns (0, None) for first-time visitors.
+    """
+    value = request.get_signed_cookie(VISITS_COOKIE, default=None, salt=VISITS_SALT)
+    if value:
+        try:
+            visits, day = value.split(':')
+            return int(visits), int(day)
+        except ValueError:
+            pass
+
+    return _read_session(request)
+
+
+def count_visit(request):
+    """
+    Counts a visit to the site: the count goes up by one on the first visit
+    of each day. Returns (visits, changed); when changed is True the new
+    count has to be stored with set_visits_cookie().
+    """
+    visits, day = read_visits(request)
+    if not visits:
+        return 1, True
+    if day is None or epoch_day() > day:
+        return visits + 1, True
+
+    # Visitors carried over from the session still need the cookie.
+    changed = VISITS_COOKIE not in request.COOKIES
+    return visits, changed
+
+
+def set_visits_cookie(response, visits):
+    response.set_signed_cookie(VISITS_COOKIE, '%d:%d' % (visits, epoch_day()), salt=VISITS_SALT,
+                               max_age=VISITS_MAX_AGE, httponly=True)
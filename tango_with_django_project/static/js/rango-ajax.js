@@ -10,30 +10,93 @@ $(document).ready(function() {
 	});
 
 //	Refresh results but not the whole page
-	$('#search').click(function(){
-		var query;
-		query = $('#query').val();
-		$.get('/rango/category_search/', {query: query}, function(data){
+	var searched_query;
+	function show_results(query, page){
+		$.get('/rango/category_search/', {query: query, page: page}, function(data){
 			$('#search_results').html(data);
 		});
+	}
+
+	$('#search').click(function(){
+		searched_query = $('#query').val();
+		show_results(searched_query, 1);
+	});
+
+//	Page through the results of the last search
+	$('#search_results').on('click', '.search-page', function(event){
+		event.preventDefault();
+		show_results(searched_query, $(this).attr("data-page"));
 	});
 
 //	Category filter
+//	Suggestions come as JSON and are kept per prefix. When a shorter prefix
+//	came with all its categories, a longer one is narrowed down from them
+//	without asking the server. Otherwise the server is asked once typing
+//	pauses, and a newer question cancels the one still on its way.
+	var suggestions = {};
+	var suggest_timer = null;
+	var suggest_request = null;
+
+	function show_suggestions(categories){
+		var catid = $('#suggestion').attr("data-catid");
+		var list = $('<ul class="nav nav-sidebar" id="nav-sidebar"></ul>');
+		$.each(categories, function(i, category){
+			var item = $('<li></li>');
+			if(String(category[0]) == catid){
+				item.addClass('active');
+			}
+			item.append($('<a></a>').attr('href', '/rango/category/' + category[2] + '/').text(category[1]));
+			list.append(item);
+		});
+		if(categories.length == 0){
+			list.append('<li class="disabled"><a href="#">There are no category present.</a></li>');
+		}
+		$('#nav-sidebar').hide();
+		$('#cats').html(list);
+	}
+
+	function narrowed_suggestions(prefix){
+		// The categories for prefix, from a shorter prefix that had all of
+		// its own, or null if there is none.
+		for(var i = prefix.length - 1; i >= 0; i--){
+			var known = suggestions[prefix.substring(0, i)];
+			if(known && known.complete){
+				var categories = $.grep(known.categories, function(category){
+					return category[1].toLowerCase().indexOf(prefix) == 0 ||
+						category[2].toLowerCase().indexOf(prefix) == 0;
+				});
+				// With none left, the server may still know misspelt ones.
+				return categories.length ? categories : null;
+			}
+		}
+		return null;
+	}
+
 	$('#suggestion').keyup(function(){
-		var query;
-		var dict;
-		query = $(this).val();
-		catid = $(this).attr("data-catid");
-		if(catid.length != 0){
-			$.get('/rango/suggest_category/', {suggestion: query, catid: catid}, function(data){
-				$('#nav-sidebar').hide();
-				$('#cats').html(data);
-			});
-		} else {
-			$.get('/rango/suggest_category/', {suggestion: query, catid: ''}, function(data){
-				$('#nav-sidebar').hide();
-				$('#cats').html(data);
-			});
+		var prefix = $(this).val().toLowerCase();
+		clearTimeout(suggest_timer);
+		if(suggest_request){
+			suggest_request.abort();
+			suggest_request = null;
 		}
+
+		var known = suggestions[prefix];
+		if(known){
+			show_suggestions(known.categories.concat(known.similar));
+			return;
+		}
+		var narrowed = narrowed_suggestions(prefix);
+		if(narrowed){
+			show_suggestions(narrowed);
+			return;
+		}
+
+		suggest_timer = setTimeout(function(){
+			suggest_request = $.getJSON('/rango/suggest_categories/', {prefix: prefix}, function(data){
+				suggest_request = null;
+				suggestions[prefix] = data;
+				show_suggestions(data.categories.concat(data.similar));
+			});
+		}, 150);
 	});
-});
\ No newline at end of file
+});
@@ -68,6 +68,9 @@ ROOT_URLCONF = 'tango_with_django_project.urls'
 
 WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 
+# Runs the tests with buffering, the click log and caching turned off.
+TEST_RUNNER = 'rango.testrunner.RangoTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/1.7/ref/settings/#databases
@@ -79,6 +82,88 @@ DATABASES = {
     }
 }
 
+# Cache
+# The local memory cache is per process. When running several processes,
+# point this at a shared cache such as memcached so they all see the same
+# cached pages and invalidations.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# How long cached fragments and pages are kept, in seconds. They are
+# invalidated by category and page changes well before that.
+RANGO_CACHE_TIMEOUT = 24 * 60 * 60
+
+# The cached top 5 categories and pages on the index are rebuilt from the database
+# at least this often, in seconds, in case concurrent updates to them were lost.
+RANGO_LEADERBOARD_TIMEOUT = 5 * 60
+
+# Each process answers category suggestions from memory, and reads the
+# categories again at least this often, in seconds, to pick up likes counted
+# by other processes.
+RANGO_SUGGEST_INDEX_TIMEOUT = 60
+
+# Browsers and proxies may reuse category suggestions for this many seconds.
+RANGO_SUGGEST_MAX_AGE = 60
+
+# Pages shown to anonymous visitors are cached for this many seconds, so the
+# like and view counts on them are at most this old. Saving or deleting a
+# category or page drops them at once. Set to 0 to turn the page cache off.
+RANGO_PAGE_CACHE_TIMEOUT = 60
+
+# Where searches go: 'bing' for the web through the Bing API, 'local' for our
+# own categories and pages, 'fixture' to replay the results recorded in the
+# RANGO_SEARCH_FIXTURE file, or the dotted path of a rango.search.SearchBackend
+# subclass. 'local' and 'fixture' need no network.
+RANGO_SEARCH_BACKEND = 'bing'
+RANGO_SEARCH_FIXTURE = None
+
+# Searching within a category searches all these backends at the same time, on
+# RANGO_SEARCH_FANOUT_THREADS threads per process, and shows what they found
+# within RANGO_SEARCH_FANOUT_DEADLINE seconds.
+RANGO_SEARCH_FANOUT_SOURCES = ('bing', 'bing-news', 'local')
+RANGO_SEARCH_FANOUT_THREADS = 8
+RANGO_SEARCH_FANOUT_DEADLINE = 2.0
+
+# While a page of search results is being read, the next page is searched
+# in the background so it is already cached when asked for.
+RANGO_SEARCH_PREFETCH = True
+
+# Bing search results are cached in each process for RANGO_SEARCH_CACHE_TIMEOUT
+# seconds, or RANGO_SEARCH_CACHE_NEGATIVE_TIMEOUT seconds when a search found
+# nothing or failed. The least recently used are dropped beyond the entry and
+# byte limits.
+RANGO_SEARCH_CACHE_TIMEOUT = 60 * 60
+RANGO_SEARCH_CACHE_NEGATIVE_TIMEOUT = 60
+RANGO_SEARCH_CACHE_MAX_ENTRIES = 1000
+RANGO_SEARCH_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Identical searches running at the same time in a process share one call to
+# Bing, and with RANGO_SEARCH_SHARED_FLIGHTS so do those in other processes,
+# through the cache (which then has to be a shared one). Searches waiting on
+# another one give up after RANGO_SEARCH_FLIGHT_TIMEOUT seconds.
+RANGO_SEARCH_SHARED_FLIGHTS = False
+RANGO_SEARCH_FLIGHT_TIMEOUT = 10
+
+# Each process keeps up to RANGO_SEARCH_POOL_SIZE connections to Bing open
+# between searches. Connecting and then each read of a search may take up to
+# the given number of seconds before the search fails.
+RANGO_SEARCH_POOL_SIZE = 4
+RANGO_SEARCH_CONNECT_TIMEOUT = 3.0
+RANGO_SEARCH_READ_TIMEOUT = 5.0
+
+# After RANGO_SEARCH_BREAKER_FAILURES failed Bing searches in a row, Bing is
+# left alone for RANGO_SEARCH_BREAKER_RESET_TIMEOUT seconds. Each process
+# makes at most RANGO_SEARCH_RATE_LIMIT Bing searches a second, in bursts of
+# up to RANGO_SEARCH_RATE_BURST; None for no limit. Searches refused either
+# way get their last results from the cache, however old, if there are any.
+RANGO_SEARCH_BREAKER_FAILURES = 5
+RANGO_SEARCH_BREAKER_RESET_TIMEOUT = 30
+RANGO_SEARCH_RATE_LIMIT = None
+RANGO_SEARCH_RATE_BURST = 10
+
 TEMPLATE_DIRS = [
     # Put strings here, like "/home/html/django_templates" or "C:/www/django/templates".
     # Always use forward slashes, even on Windows.
@@ -120,4 +205,52 @@ ACCOUNT_ACTIVATION_DAYS = 7     # One-week activation window; you may, of course
 REGISTRATION_AUTO_LOGIN = True  # If True, the user will be automatically logged in.
 LOGIN_REDIRECT_URL = '/rango/'  # The page you want users to arrive at after they successful log in
 LOGIN_URL = '/accounts/login/'  # The page users are directed to if they are not logged in,
-                                                                # and are trying to access pages requiring authentication
\ No newline at end of file
+                                                                # and are trying to access pages requiring authentication
+
+# Clicks and views are buffered in memory and written to the database in batches,
+# at most this many seconds apart, by the process that counted them. Set to 0 to
+# write every increment straight away.
+RANGO_COUNTER_FLUSH_INTERVAL = 5
+
+# Processes with buffered counts leave their pid in this directory, so the
+# flush_counters command can ask them to write the counts out. Set to None
+# to switch this off.
+RANGO_COUNTER_PID_DIR = os.path.join(BASE_DIR, 'run')
+
+# Counts that fail to be written out are reported here, and retried later
+# rather than failing the request that counted them.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'rango': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Category views are spread over this many counter rows per category.
+RANGO_CATEGORY_VIEW_SHARDS = 8
+
+# Hourly click and view buckets older than this many days are compacted into
+# daily buckets, and daily buckets older than RANGO_ACTIVITY_DAILY_DAYS into
+# monthly ones (see the compact_activity command).
+RANGO_ACTIVITY_HOURLY_DAYS = 2
+RANGO_ACTIVITY_DAILY_DAYS = 62
+
+# A like or click counts half as much towards the trending order after this many seconds.
+RANGO_TRENDING_HALF_LIFE = 24 * 60 * 60
+
+# Each process keeps today's unique visitor sketches of this many categories and
+# pages in memory, about 1KB each.
+RANGO_VISITOR_SKETCHES = 1000
+
+# Clicks, views and likes are appended to a binary log in this directory, in segments
+# of up to RANGO_CLICK_LOG_SEGMENT_SIZE bytes that are fsynced every
+# RANGO_CLICK_LOG_FSYNC_INTERVAL seconds (see the replay_clicklog command).
+# Set to None to switch the log off.
+RANGO_CLICK_LOG_DIR = os.path.join(BASE_DIR, 'clicklog')
+RANGO_CLICK_LOG_SEGMENT_SIZE = 64 * 1024 * 1024
+RANGO_CLICK_LOG_FSYNC_INTERVAL = 1.0
+